@@ -1,8 +1,7 @@
 import streamlit as st
-import subprocess
-import os
+import importlib
 
-from scripts import monitor_system, internetspeed_gauge, endpointmeter, scan_tcp, traceroute, system_info, ping, local_network
+from scripts.jobs import get_runner, STATUS_LABELS
 
 # === CONFIGURAÇÃO DO LAYOUT ===
 st.set_page_config(page_title="Painel de Ferramentas", page_icon="🛠️", layout="wide")
@@ -10,19 +9,28 @@ st.set_page_config(page_title="Painel de Ferramentas", page_icon="🛠️", layo
 # === MENU LATERAL ===
 st.sidebar.title("📌 Ferramentas")
 
+# módulos importados só quando a ferramenta é aberta (scapy, plotly, matplotlib etc. ficam fora da partida)
 scripts = {
-    "📄 Informações do Sistema": system_info,
-    "🔥 Monitorar Sistema": monitor_system,
-    "🌐 Testar Velocidade Internet": internetspeed_gauge,
-    "🌐 Ping": ping,
-    "🌐 Rede local": local_network,
-    "📊 Endpoint REST Meter": endpointmeter,
-    "📝 Scan": scan_tcp,
-    "🌐 Traceroute": traceroute
+    "📄 Informações do Sistema": "scripts.system_info",
+    "🔥 Monitorar Sistema": "scripts.monitor_system",
+    "🌐 Testar Velocidade Internet": "scripts.internetspeed_gauge",
+    "🌐 Ping": "scripts.ping",
+    "🌐 Rede local": "scripts.local_network",
+    "🚀 Vazão TCP (LAN)": "scripts.throughput",
+    "📊 Endpoint REST Meter": "scripts.endpointmeter",
+    "📝 Scan": "scripts.scan_tcp",
+    "🌐 Traceroute": "scripts.traceroute"
 }
 
 escolha = st.sidebar.radio("Selecione uma opção:", list(scripts.keys()))
 
+# Tarefas longas rodam no executor compartilhado do processo; a navegação não as interrompe
+ativos = get_runner().list(active_only=True)
+if ativos:
+    with st.sidebar.expander(f"⚙️ Tarefas em segundo plano ({len(ativos)})"):
+        for job in ativos:
+            st.caption(f"{job.label} — {STATUS_LABELS[job.status]} ({job.progress:.0%})")
+
 # === ÁREA PRINCIPAL ===
 st.title("🛠️ Painel de Ferramentas")
 
@@ -31,7 +39,7 @@ if escolha == "🏠 Início":
     st.info("Use o menu lateral para escolher uma ferramenta e executá-la.")
 
 else:
-    modulo = scripts[escolha]
+    modulo = importlib.import_module(scripts[escolha])
     if hasattr(modulo, "run"):
         modulo.run()  # roda dentro do Streamlit
     else:
@@ -0,0 +1,111 @@
+# bench_startup.py
+# Mede a partida do painel: tempo de import e da primeira renderização do app.py
+# (e, opcionalmente, de cada ferramenta), sempre em um processo Python novo.
+#
+#   python bench_startup.py                # só a partida (ferramenta padrão)
+#   python bench_startup.py --tools        # + primeira renderização de cada ferramenta
+#   python bench_startup.py --budget 3     # sai com código 1 se a partida passar de 3 s
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TOOL_TIMEOUT = 15  # s; ferramentas que se redesenham sem parar esgotam este tempo
+HEAVY = ["scapy", "matplotlib", "plotly", "speedtest", "pandas", "networkx", "requests"]
+
+# roda em um processo novo: import do streamlit, primeira renderização e,
+# se pedido, a troca para outra ferramenta no menu. O retrato dos módulos é
+# tirado antes do import do AppTest, que já traz parte dos pesados (ex.: plotly)
+PROBE = """
+import json, sys, time
+before = set(sys.modules)
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+by_streamlit = set(sys.modules) - before
+at = AppTest.from_file({app!r}, default_timeout=120).run()
+t2 = time.perf_counter()
+tool = {tool!r}
+continuous = False
+if tool:
+    try:
+        at.sidebar.radio[0].set_value(tool).run(timeout={tool_timeout!r})
+    except RuntimeError:
+        continuous = True  # ferramenta com atualização contínua (st.rerun em laço)
+t3 = time.perf_counter()
+print(json.dumps({{
+    "continuous": continuous,
+    "streamlit_import": t1 - t0,
+    "first_render": t2 - t1,
+    "tool_render": t3 - t2 if tool else None,
+    "errors": [e.message for e in at.exception],
+    "loaded": [m for m in {heavy!r} if m in sys.modules and m not in before],
+    "by_streamlit": [m for m in {heavy!r} if m in by_streamlit],
+}}))
+"""
+
+
+def measure(tool=None):
+    code = PROBE.format(app=os.path.join(ROOT, "app.py"), tool=tool, heavy=HEAVY, tool_timeout=TOOL_TIMEOUT)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    # diretório temporário: os bancos SQLite das ferramentas não caem no repositório
+    with tempfile.TemporaryDirectory() as cwd:
+        out = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                             capture_output=True, text=True, timeout=300)
+    lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+    if not lines:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "sem saída")
+    return json.loads(lines[-1])
+
+
+def tool_labels():
+    """Rótulos do menu lidos do app.py sem importá-lo (ele chama o Streamlit no topo)."""
+    import ast
+
+    tree = ast.parse(open(os.path.join(ROOT, "app.py"), encoding="utf-8").read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "scripts":
+            return [k.value for k in node.value.keys]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de partida do painel")
+    parser.add_argument("--tools", action="store_true", help="mede também cada ferramenta")
+    parser.add_argument("--runs", type=int, default=3, help="repetições da partida (usa a mediana)")
+    parser.add_argument("--budget", type=float, help="limite em segundos para a primeira renderização")
+    args = parser.parse_args()
+
+    runs = sorted((measure() for _ in range(args.runs)), key=lambda r: r["first_render"])
+    start = runs[len(runs) // 2]
+    print(f"import do streamlit: {start['streamlit_import']:.3f} s "
+          f"(já carrega: {', '.join(start['by_streamlit']) or 'nenhum módulo pesado'})")
+    print(f"primeira renderização: {start['first_render']:.3f} s (mediana de {args.runs})")
+    print(f"módulos pesados no processo: {', '.join(start['loaded']) or 'nenhum'}")
+    for err in start["errors"]:
+        print(f"  erro: {err}")
+
+    if args.tools:
+        print()
+        for label in tool_labels():
+            try:
+                r = measure(label)
+                if r["continuous"]:
+                    print(f"{label:35} atualização contínua (sem fim de renderização em {TOOL_TIMEOUT} s)")
+                    continue
+                print(f"{label:35} {r['tool_render']:.3f} s  [{', '.join(r['loaded'])}]"
+                      + (f"  erro: {r['errors'][0]}" if r["errors"] else ""))
+            except Exception as e:
+                print(f"{label:35} falhou: {e}")
+
+    if args.budget is not None and start["first_render"] > args.budget:
+        print(f"\nAcima do limite: {start['first_render']:.3f} s > {args.budget:.3f} s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
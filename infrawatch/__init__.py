@@ -0,0 +1,3 @@
+# infrawatch
+# Modo headless das ferramentas do painel: `python -m infrawatch <ferramenta> ...`
+# roda os mesmos motores de scripts/ sem o Streamlit e emite JSON lines.
@@ -0,0 +1,5 @@
+import sys
+
+from infrawatch.cli import main
+
+sys.exit(main())
@@ -0,0 +1,424 @@
+# cli.py
+# CLI em lote: alvos por argumento, arquivo (-f) ou stdin, resultados como JSON lines
+# em stdout (um objeto por linha, emitido assim que fica pronto).
+#
+#   python -m infrawatch scan -p 22,80,443 10.0.0.1 10.0.0.2
+#   cat hosts.txt | python -m infrawatch ping -c 5
+#   python -m infrawatch traceroute -f destinos.txt --engine udp
+#   python -m infrawatch load https://api.exemplo.com/health -n 500 -c 20
+#   python -m infrawatch throughput 10.0.0.5 --streams 8 --duration 5
+#   python -m infrawatch sweep 192.168.0.0/24 --method arp --save
+#   python -m infrawatch speedtest
+#
+# Os motores ficam em scripts/ e são importados só pelo subcomando que os usa; streamlit,
+# pandas e plotly só entram nas funções de interface desses módulos, não no CLI.
+# Código de saída: 0 sem erros, 1 se algum alvo falhou, 2 para uso inválido.
+
+import argparse
+import concurrent.futures
+import ipaddress
+import itertools
+import json
+import re
+import sys
+import threading
+import time
+
+_out_lock = threading.Lock()
+COMMENT_RE = re.compile(r"(?:^|\s)#.*")  # '#' só abre comentário no início ou após espaço (URLs têm #fragmento)
+
+
+class UsageError(ValueError):
+    """Opção inválida detectada pelo subcomando: sai com código 2, como os erros do argparse."""
+
+
+class Output:
+    """Escreve os registros JSON (thread-safe) e lembra se algum deles foi um erro."""
+
+    def __init__(self, tool, stream=None):
+        self.tool = tool
+        self.stream = stream or sys.stdout
+        self.failed = False
+
+    def emit(self, kind, **fields):
+        if fields.get("error") is not None:
+            self.failed = True
+        record = {"tool": self.tool, "type": kind, "ts": round(time.time(), 3), **fields}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with _out_lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def read_targets(args):
+    """Alvos dos argumentos + arquivos (-f, '-' = stdin); sem nenhum, lê o stdin se for pipe."""
+    lines = list(args.targets)
+    for path in args.file or []:
+        if path == "-":
+            lines.extend(sys.stdin)
+        else:
+            with open(path, encoding="utf-8") as f:
+                lines.extend(f)
+    if not lines and not args.file and not sys.stdin.isatty():
+        lines.extend(sys.stdin)
+    targets = []
+    for line in lines:
+        line = COMMENT_RE.sub("", line).strip()
+        if line:
+            targets.append(line)
+    return list(dict.fromkeys(targets))
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+# ---- scan ----
+def cmd_scan(args, targets, out):
+    from scripts.scan_tcp import parse_ports, scan_targets, open_store, save_scan
+
+    ports = parse_ports(args.ports)
+    if not ports:
+        raise UsageError(f"nenhuma porta válida em {args.ports!r}")
+
+    def on_result(target, port, is_open):
+        if is_open:
+            out.emit("open", target=target, port=port)
+
+    started = time.time()
+    open_ports, errors = scan_targets(
+        targets, ports, timeout=args.timeout, global_limit=args.concurrency,
+        per_host_limit=args.per_host, on_result=on_result,
+    )
+    finished = time.time()
+    for target in targets:
+        error = errors.get(target)
+        out.emit("host", target=target, open_ports=open_ports.get(target, []),
+                 error=str(error) if error else None)
+    if args.save:
+        conn = open_store()
+        try:
+            save_scan(conn, started, finished, args.ports, open_ports, errors)
+        finally:
+            conn.close()
+
+
+# ---- ping ----
+def cmd_ping(args, targets, out):
+    from scripts.ping import PingStats, ping_targets
+
+    stats = [PingStats(t) for t in targets]
+    engine = ping_targets(stats, args.count, args.interval, args.timeout)
+    for st_ in stats:
+        row = st_.row()
+        out.emit(
+            "summary", target=st_.target, address=st_.address, engine=engine,
+            sent=row["Enviados"], received=row["Recebidos"], loss_pct=row["Perda %"],
+            min_ms=row["Min (ms)"], avg_ms=row["Avg (ms)"], max_ms=row["Max (ms)"], mdev_ms=row["Mdev (ms)"],
+            error=st_.error or ("sem resposta" if row["Enviados"] and not row["Recebidos"] else None),
+        )
+
+
+# ---- traceroute ----
+def cmd_traceroute(args, targets, out):
+    from scripts.traceroute import stream_traceroute, native_traceroute, resolve, GeoLocator, is_public_ip
+
+    locator = GeoLocator(args.offline_geo) if args.geo else None
+
+    def one(target):
+        hops, last_ip = 0, None
+        try:
+            if args.engine == "command":
+                path = stream_traceroute(target, max_silent=args.max_silent, max_hops=args.max_hops)
+            else:
+                path = (
+                    (hop, ip, sum(rtts) / len(rtts) if rtts else None)
+                    for hop, ip, rtts in native_traceroute(target, max_hops=args.max_hops, protocol=args.engine)
+                )
+            for hop, ip, avg_rtt in path:
+                hops += 1
+                last_ip = ip
+                fields = {"target": target, "hop": hop, "ip": None if ip == "*" else ip, "rtt_ms": avg_rtt}
+                if locator and is_public_ip(ip):
+                    try:
+                        fields["geo"] = locator.lookup([ip])[ip]
+                    except Exception as e:
+                        fields["geo"], fields["geo_error"] = None, f"{type(e).__name__}: {e}"
+                out.emit("hop", **fields)
+            out.emit("done", target=target, hops=hops, reached=last_ip is not None and last_ip == resolve(target),
+                     error=None)
+        except Exception as e:
+            out.emit("done", target=target, hops=hops, reached=False, error=f"{type(e).__name__}: {e}")
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.parallel)) as ex:
+            list(ex.map(one, targets))
+    finally:
+        if locator:
+            locator.close()
+
+
+# ---- load (endpointmeter) ----
+def cmd_load(args, targets, out):
+    from scripts.endpointmeter import LiveSeries, run_load, run_rate, run_multiprocess, is_error
+    from scripts.histogram import LatencyHistogram
+
+    payload = json.loads(args.data) if args.data else None
+    model = "open" if args.rate else "closed"
+    for url in targets:
+        def on_row(row, url=url):
+            out.emit("second", url=url, second=row["Segundo"], requests=row["RPS"], error_pct=row["Erros %"],
+                     p50_ms=row["p50 (ms)"], p90_ms=row["p90 (ms)"], p99_ms=row["p99 (ms)"])
+
+        series = LiveSeries(on_row=on_row)
+        params = dict(url=url, method=args.method, payload=payload, keep_alive=not args.no_keep_alive,
+                      pool_size=args.pool_size, timeout=args.timeout, on_second=series.add)
+        if model == "closed":
+            params.update(num_requests=args.requests, concurrency=args.concurrency)
+        else:
+            params.update(rate=args.rate, duration=args.duration, ramp_up=args.ramp_up,
+                          max_in_flight=args.max_in_flight)
+        try:
+            if args.processes > 1:
+                result = run_multiprocess(model, args.processes, **params)
+            elif model == "closed":
+                result = run_load(**params)
+            else:
+                result = run_rate(**params)
+        except Exception as e:
+            out.emit("summary", url=url, error=f"{type(e).__name__}: {e}")
+            continue
+        series.close()
+
+        total = LatencyHistogram()
+        for hist in result["histograms"].values():
+            total.merge(hist)
+        errors = result["histograms"]["ERR"].count if "ERR" in result["histograms"] else 0
+        failed = sum(h.count for status, h in result["histograms"].items() if is_error(status))
+        error_pct = round(100 * failed / total.count, 3) if total.count else None
+        fields = {
+            "url": url, "model": model, "requests": total.count, "errors": errors, "error_pct": error_pct,
+            "status": {str(k): h.count for k, h in result["histograms"].items()},
+            "rps": round(total.count / result["wall"], 3) if result["wall"] > 0 else 0.0,
+            "wall_s": round(result["wall"], 3), "mean_ms": ms(total.mean),
+            "p50_ms": ms(total.percentile(50)), "p90_ms": ms(total.percentile(90)),
+            "p99_ms": ms(total.percentile(99)), "p99_9_ms": ms(total.percentile(99.9)),
+            "max_ms": ms(total.max) if total.count else None,
+        }
+        if model == "open":
+            fields.update(sent=result["sent"], target_rate=result["target_rate"], late=result["late"],
+                          dispatch_late=result["dispatch_late"], dispatch_max_lag_ms=ms(result["dispatch_max_lag"]))
+        # falha do alvo: nenhuma resposta, tudo com erro (ERR ou HTTP >= 400) ou acima de --max-error-rate
+        if not total.count:
+            fields["error"] = "nenhuma resposta"
+        elif failed == total.count:
+            fields["error"] = "todas as requisições falharam"
+        elif args.max_error_rate is not None and error_pct > args.max_error_rate:
+            fields["error"] = f"taxa de erro {error_pct:g}% acima do limite de {args.max_error_rate:g}%"
+        else:
+            fields["error"] = None
+        out.emit("summary", **fields)
+
+
+# ---- throughput ----
+def cmd_throughput(args, targets, out):
+    from scripts.throughput import run_client, UPLOAD, DOWNLOAD
+
+    direction = DOWNLOAD if args.download else UPLOAD
+    for host in targets:
+        def on_interval(t, mbps, host=host):
+            out.emit("interval", host=host, t=round(t, 3), mbps=round(sum(mbps), 3),
+                     streams=[round(m, 3) for m in mbps])
+
+        try:
+            result = run_client(host, args.port, streams=args.streams, duration=args.duration,
+                                direction=direction, interval=args.interval, on_interval=on_interval)
+        except Exception as e:
+            out.emit("summary", host=host, error=f"{type(e).__name__}: {e}")
+            continue
+        out.emit(
+            "summary", host=host, direction="download" if args.download else "upload",
+            elapsed_s=round(result["elapsed"], 3), bytes=sum(result["bytes"]),
+            mbps=round(result["total_mbps"], 3), streams=[round(m, 3) for m in result["mbps"]],
+            error=str(result["errors"][0]) if result["errors"] else None,
+        )
+
+
+# ---- sweep (local_network) ----
+def cmd_sweep(args, targets, out):
+    from scripts.local_network import MAX_HOSTS, probe_hosts, open_inventory, record_probe
+
+    method = {"icmp": "ICMP", "arp": "ARP", "command": "command"}[args.method]
+    for target in targets:
+        try:
+            network = ipaddress.ip_network(target, strict=False)
+        except ValueError as e:
+            out.emit("done", network=target, alive=0, probed=0, error=str(e))
+            continue
+        if network.version != 4:
+            out.emit("done", network=target, alive=0, probed=0, error="a varredura só suporta IPv4")
+            continue
+        hosts = [str(ip) for ip in itertools.islice(network.hosts(), MAX_HOSTS)]
+        alive = {}
+        lock = threading.Lock()
+
+        def on_alive(ip, mac=None, network=network, alive=alive, lock=lock):
+            with lock:
+                if ip in alive and (mac is None or alive[ip] == mac):
+                    return
+                alive[ip] = mac
+            out.emit("host", network=str(network), ip=ip, mac=mac)
+
+        def on_result(ip, ok, on_alive=on_alive):
+            if ok:
+                on_alive(ip)
+
+        error = probe_hosts(method, network, hosts, args.iface, args.concurrency, args.rate, on_alive, on_result)
+        if args.save and not error:
+            conn = open_inventory()
+            try:
+                record_probe(conn, network, hosts, alive, time.time())
+            finally:
+                conn.close()
+        out.emit("done", network=str(network), alive=len(alive), probed=len(hosts),
+                 truncated=network.num_addresses - 2 > MAX_HOSTS,
+                 error=error.removeprefix("⚠️ ") if error else None)
+
+
+# ---- speedtest (internetspeed_gauge) ----
+def cmd_speedtest(args, targets, out):
+    from scripts.internetspeed_gauge import speedtest_job, history_rows, PHASES
+    from scripts.jobs import get_runner
+
+    if args.history is not None:
+        for ts, server, ping, download, upload in history_rows(args.history):
+            out.emit("result", at=round(ts, 3), server=server, ping_ms=ping, download_mbps=download,
+                     upload_mbps=upload, error=None)
+        return
+
+    # mesmo job da página (cache do servidor e gravação no histórico); as fases viram registros
+    job = get_runner().submit(speedtest_job, key="speedtest", label="Teste de velocidade")
+    phase = None
+    try:
+        while not job.wait(0.2):
+            if job.message and job.message != phase:
+                phase = job.message
+                out.emit("phase", phase=phase, label=PHASES.get(phase, phase))
+    except KeyboardInterrupt:
+        job.cancel()
+        raise
+    result = job.result
+    if job.error or not result:
+        out.emit("summary", error=f"{type(job.error).__name__}: {job.error}" if job.error else "teste interrompido")
+        return
+    out.emit("summary", server=result["server"], ping_ms=result["ping"], download_mbps=round(result["download"], 3),
+             upload_mbps=round(result["upload"], 3), error=None)
+
+
+COMMANDS = {
+    "scan": cmd_scan,
+    "ping": cmd_ping,
+    "traceroute": cmd_traceroute,
+    "load": cmd_load,
+    "throughput": cmd_throughput,
+    "sweep": cmd_sweep,
+    "speedtest": cmd_speedtest,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m infrawatch",
+        description="Ferramentas do InfraWatch sem interface: resultados em JSON lines no stdout.",
+    )
+    sub = parser.add_subparsers(dest="tool", required=True)
+
+    def add(name, help_text, target_help=None):
+        p = sub.add_parser(name, help=help_text, description=help_text)
+        if target_help is None:  # ferramenta sem alvos
+            p.set_defaults(targets=None, file=None)
+            return p
+        p.add_argument("targets", nargs="*", help=target_help)
+        p.add_argument("-f", "--file", action="append", metavar="ARQUIVO",
+                       help="lista de alvos, um por linha ('-' = stdin; # no início ou após espaço inicia comentário)")
+        return p
+
+    p = add("scan", "Scan de portas TCP (connect)", "hosts ou IPs")
+    p.add_argument("-p", "--ports", default="1-1024", help="portas e ranges, ex.: 22,80,8000-8100")
+    p.add_argument("--timeout", type=float, default=1.0, help="timeout por conexão (s)")
+    p.add_argument("--concurrency", type=int, default=2000, help="conexões simultâneas no total")
+    p.add_argument("--per-host", type=int, default=500, help="conexões simultâneas por host")
+    p.add_argument("--save", action="store_true", help="grava o scan no histórico (scan_history.db)")
+
+    p = add("ping", "Ping ICMP de vários alvos em paralelo", "hosts ou IPs")
+    p.add_argument("-c", "--count", type=int, default=4, help="pacotes por alvo")
+    p.add_argument("-i", "--interval", type=float, default=1.0, help="intervalo entre pacotes (s)")
+    p.add_argument("-W", "--timeout", type=float, default=1.0, help="timeout por pacote (s)")
+
+    p = add("traceroute", "Traceroute hop a hop", "destinos")
+    p.add_argument("--engine", choices=["command", "udp", "icmp"], default="command",
+                   help="comando traceroute ou motor nativo (NET_RAW) UDP/ICMP")
+    p.add_argument("--max-hops", type=int, default=30)
+    p.add_argument("--max-silent", type=int, default=5, help="para após N hops seguidos sem resposta (comando)")
+    p.add_argument("--parallel", type=int, default=4, help="destinos rastreados ao mesmo tempo")
+    p.add_argument("--geo", action="store_true", help="inclui a geolocalização dos IPs públicos")
+    p.add_argument("--offline-geo", action="store_true", help="geolocaliza pela base GeoLite2 local (GEOIP_DB)")
+
+    p = add("load", "Teste de carga HTTP (modelo fechado, ou aberto com --rate)", "URLs (testadas uma por vez)")
+    p.add_argument("-n", "--requests", type=int, default=50, help="total de requisições (modelo fechado)")
+    p.add_argument("-c", "--concurrency", type=int, default=5, help="concorrência (modelo fechado)")
+    p.add_argument("--rate", type=float, help="taxa alvo em req/s (ativa o modelo aberto)")
+    p.add_argument("--duration", type=float, default=30.0, help="duração (s) no modelo aberto")
+    p.add_argument("--ramp-up", type=float, default=0.0, help="ramp-up (s) no modelo aberto")
+    p.add_argument("--max-in-flight", type=int, default=100, help="requisições em voo no modelo aberto")
+    p.add_argument("-X", "--method", choices=["GET", "POST"], default="GET")
+    p.add_argument("-d", "--data", help="payload JSON (POST)")
+    p.add_argument("--processes", type=int, default=1, help="processos geradores")
+    p.add_argument("--pool-size", type=int, help="conexões keep-alive compartilhadas (padrão: uma por worker)")
+    p.add_argument("--no-keep-alive", action="store_true", help="nova conexão a cada requisição")
+    p.add_argument("--timeout", type=float, default=10.0, help="timeout por requisição (s); estouro conta como erro")
+    p.add_argument("--max-error-rate", type=float, metavar="PCT",
+                   help="falha o alvo se mais de PCT%% das requisições derem erro (padrão: só se todas falharem)")
+
+    p = add("throughput", "Vazão TCP contra um servidor `python -m scripts.throughput`", "hosts do servidor")
+    p.add_argument("--port", type=int, default=5201)
+    p.add_argument("--streams", type=int, default=4, help="streams TCP paralelos")
+    p.add_argument("--duration", type=float, default=10.0, help="duração (s)")
+    p.add_argument("--interval", type=float, default=1.0, help="intervalo dos relatórios parciais (s)")
+    p.add_argument("--download", action="store_true", help="mede servidor -> cliente (padrão: upload)")
+
+    p = add("sweep", "Descoberta de hosts ativos em sub-redes", "sub-redes (CIDR) ou IPs")
+    p.add_argument("--method", choices=["icmp", "arp", "command"], default="icmp",
+                   help="ICMP direto (cai para o comando ping sem permissão), ARP (NET_RAW, mesma LAN) ou comando ping")
+    p.add_argument("--iface", help="interface de rede (ARP)")
+    p.add_argument("--rate", type=int, default=2000, help="pacotes/s no ICMP direto")
+    p.add_argument("--concurrency", type=int, default=256, help="pings simultâneos (comando ping)")
+    p.add_argument("--save", action="store_true", help="grava a varredura no inventário (network_inventory.db)")
+
+    p = add("speedtest", "Teste de velocidade da Internet (speedtest.net)")
+    p.add_argument("--history", type=int, metavar="DIAS", help="só lista os resultados gravados nos últimos DIAS dias")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    targets = None
+    if args.targets is not None:
+        try:
+            targets = read_targets(args)
+        except OSError as e:
+            parser.error(str(e))
+        if not targets:
+            parser.error("nenhum alvo informado (argumentos, -f ARQUIVO ou stdin)")
+
+    out = Output(args.tool)
+    try:
+        COMMANDS[args.tool](args, targets, out)
+    except UsageError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        out.emit("error", error=f"{type(e).__name__}: {e}")
+    return 1 if out.failed else 0
@@ -1,64 +1,751 @@
-import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import time
+import json
+import threading
+import multiprocessing
+import os
+import queue
 import concurrent.futures
-import statistics
-import matplotlib.pyplot as plt
+
+from scripts.histogram import LatencyHistogram
+from scripts.jobs import get_runner, QUEUED
+
+
+MODELS = {
+    "Fechado (N requisições, concorrência fixa)": "closed",
+    "Aberto (taxa constante de chegada)": "open",
+}
+
+MODES = {
+    "Pool keep-alive (sessão compartilhada)": "pool",
+    "Nova conexão por requisição": "new",
+    "Comparar os dois": "both",
+}
+
+
+def make_session(pool_size=1):
+    """
+    Cria uma Session com keep-alive e no máximo `pool_size` conexões (pool_block:
+    sem conexão livre, a requisição espera uma ser devolvida em vez de abrir outra).
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+PERCENTILES = [50, 90, 99, 99.9]
+
+# Atraso (s) a partir do qual uma requisição do modelo aberto conta como "saiu atrasada"
+LATE_THRESHOLD = 0.01
+
+# Tempo máximo (s) de uma requisição; ao estourar ela conta como "ERR"
+REQUEST_TIMEOUT = 10.0
+
+
+def make_requester(url, method="GET", payload=None, keep_alive=True, pool_size=1, timeout=REQUEST_TIMEOUT):
+    """
+    Retorna (request, close).
+    request() faz uma requisição e devolve o status (ou "ERR", inclusive por timeout:
+    `timeout` s para conectar e entre pacotes da resposta).
+    keep_alive=True: todas as threads usam uma única Session, com até `pool_size`
+    conexões TCP/TLS reaproveitadas (menos conexões que threads = espera por uma livre).
+    keep_alive=False: cada requisição abre e fecha a sua conexão (Connection: close).
+    close() encerra a sessão.
+    """
+    session = make_session(pool_size) if keep_alive else None
+
+    def request():
+        try:
+            if keep_alive:
+                resp = session.request(method, url, json=payload, timeout=timeout)
+            else:
+                resp = requests.request(method, url, json=payload, headers={"Connection": "close"},
+                                        timeout=timeout)
+            return resp.status_code
+        except Exception:
+            return "ERR"
+
+    def close():
+        if session is not None:
+            session.close()
+
+    return request, close
+
+
+def is_error(status):
+    return status == "ERR" or status >= 400
+
+
+def record(histograms, live, status, elapsed):
+    """Registra `elapsed` no histograma do status (criando se necessário) e no LiveStats."""
+    hist = histograms.get(status)
+    if hist is None:
+        hist = histograms[status] = LatencyHistogram()
+    hist.record(elapsed)
+    if live is not None:
+        live.record(status, elapsed)
+
+
+class LiveStats:
+    """
+    Acumula as requisições do segundo corrente (epoch, comparável entre processos)
+    e, a cada virada de segundo, entrega (segundo, histograma, requisições, erros)
+    para `sink`. Só um histograma fica em memória por processo.
+    Uma thread fecha os segundos pelo relógio, então um servidor parado aparece
+    como segundos com 0 requisições em vez de congelar a série.
+    """
+
+    TICK = 0.25  # s entre verificações da virada de segundo
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.lock = threading.Lock()
+        self.sec = int(time.time())
+        self._reset()
+        self.closed = threading.Event()
+        self.ticker = threading.Thread(target=self._tick, daemon=True)
+        self.ticker.start()
+
+    def _reset(self):
+        self.hist = LatencyHistogram()
+        self.count = 0
+        self.errors = 0
+
+    def _advance(self, sec):
+        """Entrega o segundo corrente e os vazios até `sec` (exclusive)."""
+        while self.sec < sec:
+            self.sink(self.sec, self.hist, self.count, self.errors)
+            self._reset()
+            self.sec += 1
+
+    def _tick(self):
+        while not self.closed.wait(self.TICK):
+            with self.lock:
+                self._advance(int(time.time()))
+
+    def record(self, status, elapsed):
+        with self.lock:
+            self._advance(int(time.time()))
+            self.hist.record(elapsed)
+            self.count += 1
+            if is_error(status):
+                self.errors += 1
+
+    def flush(self):
+        self.closed.set()
+        self.ticker.join()
+        with self.lock:
+            if self.count:
+                self.sink(self.sec, self.hist, self.count, self.errors)
+            self._reset()
+
+
+class LiveSeries:
+    """
+    Série temporal por segundo (RPS, % de erro, p50/p90/p99) montada a partir do
+    que os LiveStats entregam. Segundos de processos diferentes são combinados
+    enquanto ainda estão "abertos"; depois viram uma linha compacta, também
+    entregue a `on_row` (se informado) assim que consolidada.
+    """
+
+    SETTLE_SECONDS = 2
+
+    def __init__(self, on_row=None):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.rows = []
+        self.on_row = on_row
+
+    def add(self, sec, hist, count, errors):
+        with self.lock:
+            if sec in self.pending:
+                p_hist, p_count, p_errors = self.pending[sec]
+                self.pending[sec] = (p_hist.merge(hist), p_count + count, p_errors + errors)
+            else:
+                self.pending[sec] = (hist, count, errors)
+            self._settle(int(time.time()) - self.SETTLE_SECONDS)
+
+    def _settle(self, before):
+        for sec in sorted(k for k in self.pending if k < before):
+            hist, count, errors = self.pending.pop(sec)
+            self.rows.append({
+                "Segundo": sec,
+                "RPS": count,
+                "Erros %": round(100 * errors / count, 2) if count else 0.0,
+                "p50 (ms)": round(hist.percentile(50) * 1000, 2),
+                "p90 (ms)": round(hist.percentile(90) * 1000, 2),
+                "p99 (ms)": round(hist.percentile(99) * 1000, 2),
+            })
+            if self.on_row:
+                self.on_row(self.rows[-1])
+
+    def close(self):
+        with self.lock:
+            self._settle(float("inf"))
+
+    def snapshot(self):
+        """Linhas já consolidadas (cópia, segura para renderizar em outra thread)."""
+        with self.lock:
+            return list(self.rows)
+
+
+def merge_histograms(per_worker):
+    """Combina uma lista de {status: LatencyHistogram} em um único dict."""
+    merged = {}
+    for histograms in per_worker:
+        for status, hist in histograms.items():
+            if status in merged:
+                merged[status].merge(hist)
+            else:
+                merged[status] = hist
+    return merged
+
+
+def run_load(url, method="GET", payload=None, num_requests=50, concurrency=5, keep_alive=True, pool_size=None,
+             timeout=REQUEST_TIMEOUT, stop=None, on_second=None):
+    """
+    Modelo fechado: dispara `num_requests` requisições com `concurrency` threads.
+    Cada worker registra latências (time.perf_counter) no seu próprio histograma por
+    status; no fim eles são combinados, então a memória não cresce com `num_requests`.
+    `timeout` limita cada requisição (estouro conta como "ERR"), então o cancelamento
+    nunca espera mais que isso por um servidor travado.
+    `pool_size`: conexões keep-alive compartilhadas pelos workers (None = uma por worker).
+    `stop` (Event) interrompe a rodada mantendo o que já foi medido;
+    `on_second(seg, hist, n, erros)` recebe o resumo de cada segundo concluído.
+    Retorna dict com {status: LatencyHistogram} e a duração.
+    """
+    request, close = make_requester(url, method, payload, keep_alive, pool_size or concurrency, timeout)
+    live = LiveStats(on_second) if on_second else None
+    worker_histograms = []
+    tickets = iter(range(num_requests))
+
+    def worker():
+        histograms = {}
+        worker_histograms.append(histograms)
+        for _ in tickets:
+            if stop is not None and stop.is_set():
+                return
+            start = time.perf_counter()
+            status = request()
+            record(histograms, live, status, time.perf_counter() - start)
+
+    started = time.time()
+    wall_start = time.perf_counter()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for f in [executor.submit(worker) for _ in range(min(concurrency, num_requests))]:
+                f.result()
+    finally:
+        close()
+        if live:
+            live.flush()
+    wall = time.perf_counter() - wall_start
+    return {
+        "histograms": merge_histograms(worker_histograms),
+        "wall": wall,
+        "started": started,
+        "ended": started + wall,
+        "cancelled": bool(stop is not None and stop.is_set()),
+    }
+
+
+def arrival_schedule(rate, duration, ramp_up=0.0):
+    """
+    Gera os instantes (s, relativos ao início) de envio para uma taxa alvo `rate`
+    durante `duration` segundos. Com `ramp_up`, a taxa cresce linearmente de 0 até
+    `rate` nos primeiros `ramp_up` segundos (inverso de N(t) = rate*t²/2R).
+    """
+    ramp_up = min(ramp_up, duration)
+    ramp_requests = rate * ramp_up / 2
+    total = int(ramp_requests + rate * (duration - ramp_up))
+    for i in range(total):
+        if i < ramp_requests:
+            yield (2 * ramp_up * i / rate) ** 0.5
+        else:
+            yield ramp_up + (i - ramp_requests) / rate
+
+
+def run_rate(url, method="GET", payload=None, rate=50.0, duration=10.0, ramp_up=0.0,
+             max_in_flight=100, keep_alive=True, pool_size=None, timeout=REQUEST_TIMEOUT, stop=None, on_second=None):
+    """
+    Modelo aberto: envia requisições em taxa constante (`rate` req/s), independente
+    de quanto o servidor demora para responder.
+    A latência é medida a partir do instante AGENDADO de envio, então atrasos por
+    falta de worker livre entram na conta (sem coordinated omission).
+    Retorna dict com histogramas por status, tempo de serviço, atrasos e contadores
+    que indicam se o próprio gerador não conseguiu manter a taxa.
+    `pool_size` (None = um por requisição em voo), `timeout`, `stop` e `on_second`
+    funcionam como em run_load.
+    """
+    request, close = make_requester(url, method, payload, keep_alive, pool_size or max_in_flight, timeout)
+    live = LiveStats(on_second) if on_second else None
+    pending = queue.Queue()
+    worker_histograms = []
+    worker_service = []
+    worker_wait = []
+    dropped = [0]  # agendadas mas descartadas pelo cancelamento (não contam como enviadas)
+    dropped_lock = threading.Lock()
+
+    def worker():
+        histograms, service, wait = {}, LatencyHistogram(), LatencyHistogram()
+        worker_histograms.append(histograms)
+        worker_service.append(service)
+        worker_wait.append(wait)
+        while True:
+            scheduled = pending.get()
+            if scheduled is None:
+                return
+            if stop is not None and stop.is_set():
+                with dropped_lock:
+                    dropped[0] += 1
+                continue
+            start = time.perf_counter()
+            status = request()
+            end = time.perf_counter()
+            record(histograms, live, status, end - scheduled)
+            service.record(end - start)
+            wait.record(max(start - scheduled, 0.0))
+
+    dispatch_late = 0
+    dispatch_max_lag = 0.0
+    sent = 0
+    started = time.time()
+    wall_start = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max_in_flight)]
+    for t in threads:
+        t.start()
+    try:
+        for offset in arrival_schedule(rate, duration, ramp_up):
+            scheduled = wall_start + offset
+            delay = scheduled - time.perf_counter()
+            if stop is not None and stop.is_set():
+                break
+            if delay > 0:
+                if stop is not None:
+                    if stop.wait(delay):
+                        break
+                else:
+                    time.sleep(delay)
+            else:
+                lag = -delay
+                dispatch_max_lag = max(dispatch_max_lag, lag)
+                if lag > LATE_THRESHOLD:
+                    dispatch_late += 1
+            pending.put(scheduled)
+            sent += 1
+    finally:
+        # cancelado: descarta o que ainda está na fila, senão os sentinelas ficam atrás de todo o backlog
+        while stop is not None and stop.is_set():
+            try:
+                pending.get_nowait()
+            except queue.Empty:
+                break
+            with dropped_lock:
+                dropped[0] += 1
+        for _ in threads:
+            pending.put(None)
+        for t in threads:
+            t.join()
+        close()
+        if live:
+            live.flush()
+    wall = time.perf_counter() - wall_start
+    cancelled = bool(stop is not None and stop.is_set())
+    sent -= dropped[0]
+
+    wait = LatencyHistogram()
+    for h in worker_wait:
+        wait.merge(h)
+    service = LatencyHistogram()
+    for h in worker_service:
+        service.merge(h)
+    return {
+        "histograms": merge_histograms(worker_histograms),
+        "service": service,
+        "wait": wait,
+        "wall": wall,
+        "started": started,
+        "ended": started + wall,
+        "cancelled": cancelled,
+        "sent": sent,
+        "target_rate": rate,
+        "send_duration": min(duration, wall) if cancelled else duration,
+        "late": wait.count_above(LATE_THRESHOLD),
+        "dispatch_late": dispatch_late,
+        "dispatch_max_lag": dispatch_max_lag,
+    }
+
+
+def split_evenly(total, parts):
+    """Divide `total` em `parts` inteiros que somam `total`."""
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def _process_main(kind, kwargs, barrier, stop, results):
+    """
+    Corpo de cada processo worker: espera todos subirem e roda o mesmo motor de threads.
+    Os resumos por segundo e o resultado final voltam para o pai pela mesma fila.
+    """
+    try:
+        barrier.wait(timeout=60)
+        on_second = lambda *args: results.put(("second", args))
+        run_engine = run_load if kind == "closed" else run_rate
+        results.put(("done", run_engine(stop=stop, on_second=on_second, **kwargs)))
+    except Exception as e:
+        results.put(("done", e))
+
+
+def merge_results(results):
+    """Combina resultados de vários processos (histogramas, contadores por segundo e totais)."""
+    started = min(r["started"] for r in results)
+    ended = max(r["ended"] for r in results)
+    merged = {
+        "histograms": merge_histograms([r["histograms"] for r in results]),
+        "wall": ended - started,
+        "started": started,
+        "ended": ended,
+        "cancelled": any(r["cancelled"] for r in results),
+    }
+    if "service" in results[0]:
+        service, wait = LatencyHistogram(), LatencyHistogram()
+        for r in results:
+            service.merge(r["service"])
+            wait.merge(r["wait"])
+        merged.update({
+            "service": service,
+            "wait": wait,
+            "sent": sum(r["sent"] for r in results),
+            "target_rate": sum(r["target_rate"] for r in results),
+            "send_duration": max(r["send_duration"] for r in results),
+            "late": sum(r["late"] for r in results),
+            "dispatch_late": sum(r["dispatch_late"] for r in results),
+            "dispatch_max_lag": max(r["dispatch_max_lag"] for r in results),
+        })
+    return merged
+
+
+def run_multiprocess(kind, processes, stop=None, on_second=None, **kwargs):
+    """
+    Roda o motor em `processes` processos (um GIL cada), dividindo a carga entre eles:
+    kind="closed" divide num_requests/concurrency, kind="open" divide rate/max_in_flight.
+    Cada processo tem a sua parte do pool de conexões e os seus histogramas; o pai só combina os resultados.
+    Usa "spawn" para não herdar as threads do servidor Streamlit.
+    `stop` (threading.Event) é repassado aos processos; `on_second` recebe os
+    resumos por segundo de todos eles.
+    """
+    if kind == "closed":
+        processes = max(1, min(processes, kwargs["num_requests"]))
+        shares = [
+            dict(kwargs, num_requests=n, concurrency=max(1, c))
+            for n, c in zip(split_evenly(kwargs["num_requests"], processes),
+                            split_evenly(kwargs["concurrency"], processes))
+        ]
+    else:
+        shares = [
+            dict(kwargs, rate=kwargs["rate"] / processes, max_in_flight=max(1, c))
+            for c in split_evenly(kwargs["max_in_flight"], processes)
+        ]
+    if kwargs.get("pool_size"):  # o pool também é dividido: cada processo tem a sua sessão
+        for share, n in zip(shares, split_evenly(kwargs["pool_size"], len(shares))):
+            share["pool_size"] = max(1, n)
+
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(len(shares))
+    mp_stop = ctx.Event()
+    results_queue = ctx.Queue()
+    procs = [
+        ctx.Process(target=_process_main, args=(kind, share, barrier, mp_stop, results_queue))
+        for share in shares
+    ]
+    for proc in procs:
+        proc.start()
+    results = []
+    try:
+        while len(results) < len(procs):
+            if stop is not None and stop.is_set() and not mp_stop.is_set():
+                mp_stop.set()
+            try:
+                tag, payload = results_queue.get(timeout=0.2)
+            except queue.Empty:
+                # fila vazia: um filho que morreu sem publicar o resultado (OOM, sinal)
+                # nunca vai publicar; as mensagens já enviadas chegam antes do exitcode
+                dead = [p for p in procs if not p.is_alive() and p.exitcode != 0]
+                if dead:
+                    raise RuntimeError(
+                        f"processo gerador terminou sem resultado (exitcode {dead[0].exitcode})"
+                    )
+                continue
+            if tag == "second":
+                if on_second:
+                    on_second(*payload)
+            else:
+                results.append(payload)
+    except BaseException:
+        # sem mp_stop.set(): o Event de multiprocessing trava se um filho morreu esperando nele
+        for proc in procs:
+            proc.terminate()
+            proc.join()
+        raise
+    for proc in procs:
+        proc.join()
+    for r in results:
+        if isinstance(r, Exception):
+            raise r
+    return merge_results(results)
+
+
+def summarize(histograms, wall):
+    """Agrega uma rodada: total, erros, throughput por tempo de parede e percentis por status."""
+    total = LatencyHistogram()
+    for hist in histograms.values():
+        total.merge(hist)
+    if not total.count:
+        return None
+    rows = []
+    for status, hist in sorted(histograms.items(), key=lambda kv: str(kv[0])) + [("Todos", total)]:
+        row = {"Status": str(status), "Requisições": hist.count, "Média (ms)": round(hist.mean * 1000, 2)}
+        for p in PERCENTILES:
+            row[f"p{p:g} (ms)"] = round(hist.percentile(p) * 1000, 2)
+        row["Máx (ms)"] = round(hist.max * 1000, 2)
+        rows.append(row)
+    return {
+        "ok": sum(h.count for s, h in histograms.items() if s != "ERR" and 200 <= s < 300),
+        "errors": histograms["ERR"].count if "ERR" in histograms else 0,
+        "avg": total.mean,
+        "throughput": total.count / wall if wall > 0 else 0.0,
+        "wall": wall,
+        "table": rows,
+        "histograms": histograms,
+    }
+
+
+def show_open_model(result):
+    """Mostra os indicadores específicos do modelo aberto (atraso de envio e tempo de serviço)."""
+    import streamlit as st
+    wait, service = result["wait"], result["service"]
+    send_rate = result["sent"] / result["send_duration"] if result["send_duration"] else 0.0
+    st.write(
+        f"🎯 Taxa alvo: {result['target_rate']:.2f} req/s — enviadas {result['sent']} "
+        f"({send_rate:.2f} req/s em média, incluindo ramp-up)"
+    )
+    st.write(
+        f"🧮 Tempo de serviço (desde o envio real): média {service.mean * 1000:.2f} ms, "
+        f"p99 {service.percentile(99) * 1000:.2f} ms"
+    )
+    st.write(
+        f"⏳ Espera até o envio: p99 {wait.percentile(99) * 1000:.2f} ms, máx {wait.max * 1000:.2f} ms"
+    )
+    if result["dispatch_late"]:
+        st.warning(
+            f"⚠️ O gerador não conseguiu manter a taxa: {result['dispatch_late']} requisições foram "
+            f"despachadas com mais de {LATE_THRESHOLD * 1000:.0f} ms de atraso "
+            f"(máx {result['dispatch_max_lag'] * 1000:.1f} ms). Os números refletem o cliente, não só o servidor."
+        )
+    elif result["late"]:
+        st.warning(
+            f"⚠️ {result['late']} requisições esperaram mais de {LATE_THRESHOLD * 1000:.0f} ms por um worker livre. "
+            "Aumente o máximo de requisições em voo se o objetivo for medir só o servidor."
+        )
+
+
+class LoadTest:
+    """
+    Estado de um teste de carga (séries ao vivo e resumos de cada rodada).
+    Roda no JobRunner (`execute`); a página guarda o job no session_state, então
+    sobrevive aos reruns do Streamlit: só lê este estado e pode pedir o cancelamento.
+    """
+
+    def __init__(self, model, processes, runs, params):
+        self.model = model
+        self.processes = processes
+        self.runs = runs
+        self.params = params
+        self.series = {}
+        self.summaries = {}
+        self.current = None
+
+    def execute(self, job):
+        for label, keep_alive in self.runs:
+            if job.cancelled:
+                break
+            self.current = label
+            job.update(message=label)
+            series = self.series[label] = LiveSeries()
+            params = dict(self.params, keep_alive=keep_alive, stop=job.stop, on_second=series.add)
+            if self.processes > 1:
+                result = run_multiprocess(self.model, self.processes, **params)
+            elif self.model == "closed":
+                result = run_load(**params)
+            else:
+                result = run_rate(**params)
+            series.close()
+            summary = summarize(result["histograms"], result["wall"])
+            if summary and self.model == "open":
+                summary["open"] = result
+            if summary:
+                self.summaries[label] = summary
+        return self.summaries
+
+
+def show_live(test):
+    """Séries por segundo (RPS, % de erro, percentis) de cada rodada do teste."""
+    import streamlit as st
+    import pandas as pd
+    for label, series in test.series.items():
+        rows = series.snapshot()
+        if not rows:
+            continue
+        df = pd.DataFrame(rows)
+        df["Segundo"] = df["Segundo"] - df["Segundo"].iloc[0]
+        df = df.set_index("Segundo")
+        st.subheader(f"📈 Ao vivo — {label}" if len(test.series) > 1 else "📈 Ao vivo")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.caption("Requisições por segundo")
+            st.line_chart(df[["RPS"]])
+        with col2:
+            st.caption("Erros (%)")
+            st.line_chart(df[["Erros %"]])
+        st.caption("Latência por segundo (ms)")
+        st.line_chart(df[["p50 (ms)", "p90 (ms)", "p99 (ms)"]])
+
+
+def show_results(summaries):
+    """Resumo final de cada rodada + distribuição de latência."""
+    import streamlit as st
+    if not summaries:
+        st.error("Nenhuma resposta válida obtida.")
+        return
+
+    st.subheader("📊 Resultados")
+    for label, summary in summaries.items():
+        if len(summaries) > 1:
+            st.markdown(f"**{label}**")
+        st.write(f"✅ Requisições bem sucedidas (2xx): {summary['ok']}")
+        st.write(f"❌ Erros: {summary['errors']}")
+        st.write(f"⏱️ Tempo médio de resposta: {summary['avg']:.3f} s")
+        st.write(f"📡 Throughput: {summary['throughput']:.2f} req/s (em {summary['wall']:.2f} s de parede)")
+        if "open" in summary:
+            show_open_model(summary["open"])
+        st.table(summary["table"])
+
+    if len(summaries) > 1:
+        pooled, fresh = summaries["Keep-alive"], summaries["Nova conexão"]
+        st.info(
+            f"🔁 Reuso de conexão: tempo médio {fresh['avg'] / pooled['avg']:.2f}x menor, "
+            f"throughput {pooled['throughput'] / fresh['throughput']:.2f}x maior."
+        )
+
+    # Gráfico: distribuição de latência (escala log) por status
+    import matplotlib.pyplot as plt  # pesado: só quando há resultado (e nunca nos processos filhos)
+
+    fig, ax = plt.subplots()
+    for label, summary in summaries.items():
+        for status, hist in summary["histograms"].items():
+            edges, counts = hist.buckets()
+            name = f"{status}" if len(summaries) == 1 else f"{label} — {status}"
+            ax.stairs(counts, [e * 1000 for e in edges], label=name)
+    ax.set_xscale("log")
+    ax.set_title("Distribuição do tempo de resposta")
+    ax.set_xlabel("Latência (ms, escala log)")
+    ax.set_ylabel("Requisições")
+    ax.legend()
+    st.pyplot(fig)
 
 
 def run():
+    import streamlit as st
+
     #st.set_page_config(page_title="Teste de Carga REST", layout="centered")
 
     st.title("🔗 Teste de Carga em Endpoint REST")
 
     url = st.text_input("Digite a URL do endpoint:", "https://jsonplaceholder.typicode.com/posts")
-    num_requests = st.number_input("Número total de requisições:", min_value=1, value=50, step=1)
-    concurrency = st.number_input("Nível de concorrência:", min_value=1, value=5, step=1)
+    model = MODELS[st.radio("Modelo de carga", list(MODELS.keys()))]
+    if model == "closed":
+        num_requests = st.number_input("Número total de requisições:", min_value=1, value=50, step=1)
+        concurrency = st.number_input("Nível de concorrência:", min_value=1, value=5, step=1)
+    else:
+        rate = st.number_input("Taxa alvo (req/s):", min_value=0.1, value=20.0, step=1.0)
+        duration = st.number_input("Duração (s):", min_value=1, value=30, step=1)
+        ramp_up = st.number_input("Ramp-up (s):", min_value=0, value=0, step=1,
+                                  help="A taxa cresce linearmente de 0 até a taxa alvo nesse intervalo.")
+        max_in_flight = st.number_input(
+            "Máx de requisições em voo:", min_value=1, value=100, step=10,
+            help="Threads disponíveis para enviar. Se acabarem, as requisições esperam e o atraso entra na latência.",
+        )
     method = st.selectbox("Método HTTP", ["GET", "POST"])
     payload = st.text_area("Payload (JSON para POST):", "{}" if method == "POST" else "", height=100)
+    mode_label = st.selectbox("Conexões", list(MODES.keys()))
+    cpu_count = os.cpu_count() or 1
+    processes = st.number_input(
+        "Processos geradores:", min_value=1, max_value=cpu_count, value=1, step=1,
+        help=f"1 = processo único com threads. Acima disso a carga é dividida entre processos "
+             f"(até {cpu_count}, um por núcleo) para não esbarrar no GIL.",
+    )
+    pool_size = st.number_input(
+        "Conexões keep-alive (pool):", min_value=0, value=0, step=1,
+        help="Conexões compartilhadas por todos os workers (0 = uma por worker). Com menos conexões "
+             "que workers, as requisições esperam uma conexão livre e a espera entra na latência.",
+    )
+    timeout = st.number_input(
+        "Timeout por requisição (s):", min_value=0.1, value=REQUEST_TIMEOUT, step=1.0,
+        help="Requisições sem resposta nesse tempo contam como erro (ERR).",
+    )
 
-    if st.button("🚀 Iniciar Teste"):
-        st.write("Executando...")
+    job = st.session_state.get("endpointmeter_job")
+    running = job is not None and job.active
 
-        times = []
+    if st.button("🚀 Iniciar Teste", disabled=running):
+        try:
+            body = json.loads(payload) if method == "POST" and payload.strip() else None
+        except ValueError as e:
+            st.error(f"Payload inválido (JSON): {e}")
+            return
 
-        def make_request(_):
-            try:
-                start = time.time()
-                if method == "GET":
-                    resp = requests.get(url)
-                else:
-                    resp = requests.post(url, json=eval(payload))
-                elapsed = time.time() - start
-                return resp.status_code, elapsed
-            except Exception as e:
-                return "ERR", None
+        mode = MODES[mode_label]
+        runs = [("Keep-alive", True), ("Nova conexão", False)]
+        if mode == "pool":
+            runs = runs[:1]
+        elif mode == "new":
+            runs = runs[1:]
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
-            results = list(executor.map(make_request, range(num_requests)))
-
-        # Filtrar resultados válidos
-        status_codes = [r[0] for r in results]
-        response_times = [r[1] for r in results if r[1] is not None]
-
-        if response_times:
-            avg_time = statistics.mean(response_times)
-            p95 = statistics.quantiles(response_times, n=100)[94]  # 95º percentil
-            throughput = num_requests / sum(response_times)
-
-            st.subheader("📊 Resultados")
-            st.write(f"✅ Requisições bem sucedidas: {status_codes.count(200)}")
-            st.write(f"❌ Erros: {status_codes.count('ERR')}")
-            st.write(f"⏱️ Tempo médio de resposta: {avg_time:.3f} s")
-            st.write(f"⚡ Percentil 95: {p95:.3f} s")
-            st.write(f"📡 Throughput: {throughput:.2f} req/s")
-
-            # Gráfico
-            fig, ax = plt.subplots()
-            ax.plot(response_times, marker="o")
-            ax.set_title("Tempo de resposta por requisição")
-            ax.set_xlabel("Requisição #")
-            ax.set_ylabel("Segundos")
-            st.pyplot(fig)
+        params = dict(url=url, method=method, payload=body, pool_size=int(pool_size) or None, timeout=float(timeout))
+        if model == "closed":
+            params.update(num_requests=int(num_requests), concurrency=int(concurrency))
         else:
-            st.error("Nenhuma resposta válida obtida.")
+            params.update(rate=float(rate), duration=float(duration), ramp_up=float(ramp_up),
+                          max_in_flight=int(max_in_flight))
+        test = LoadTest(model, int(processes), runs, params)
+        key = ("endpointmeter", model, int(processes), tuple(runs), json.dumps(params, sort_keys=True, default=str))
+        job = get_runner().submit(test.execute, key=key, label=f"Carga em {url}", state=test)
+        st.session_state["endpointmeter_job"] = job
+
+    if job is None:
+        return
+    test = job.state
+
+    if job.active:
+        if job.status == QUEUED:
+            st.info("⏳ Na fila: o limite de tarefas simultâneas do servidor foi atingido.")
+        else:
+            st.info(f"⏳ Executando ({test.current or 'iniciando'})... os gráficos abaixo atualizam a cada segundo.")
+        if st.button("⏹️ Cancelar teste"):
+            job.cancel()
+
+    show_live(test)
+
+    if not job.active:
+        if job.error:
+            st.error(f"Erro durante o teste: {job.error}")
+        if job.cancelled:
+            st.warning("Teste cancelado — resultados parciais abaixo.")
+        show_results(test.summaries)
+    else:
+        # ---- Atualização automática enquanto o teste roda ----
+        time.sleep(1)
+        st.rerun()
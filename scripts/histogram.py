@@ -0,0 +1,91 @@
+# histogram.py
+# Histograma de latência com buckets logarítmicos (estilo HDR) e memória fixa.
+# Usado pelo endpointmeter para registrar milhões de amostras sem guardar cada valor.
+
+import math
+from array import array
+
+
+class LatencyHistogram:
+    """
+    Registra latências (em segundos) em buckets de largura relativa `precision`
+    entre `min_value` e `max_value`. Valores fora da faixa caem no primeiro/último
+    bucket, mas min/max exatos são preservados.
+    Com os defaults (1 µs .. 1 h, 1%) são ~2200 contadores de 8 bytes.
+    """
+
+    def __init__(self, min_value=1e-6, max_value=3600.0, precision=0.01):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        size = self._index(max_value) + 1
+        self.counts = array("Q", bytes(8 * size))
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, value):
+        if value <= self.min_value:
+            return 0
+        return int(math.log(value / self.min_value) / self._log_base)
+
+    def _lower_bound(self, index):
+        return self.min_value * math.exp(index * self._log_base)
+
+    def record(self, value, n=1):
+        index = min(self._index(value), len(self.counts) - 1)
+        self.counts[index] += n
+        self.count += n
+        self.total += value * n
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Soma outro histograma com a mesma configuração neste."""
+        if (other.min_value, other.max_value, other.precision) != (self.min_value, self.max_value, self.precision):
+            raise ValueError("Histogramas com configurações diferentes não podem ser combinados")
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Valor no percentil `p` (0-100), com erro relativo <= precision."""
+        if not self.count:
+            return 0.0
+        if p >= 100:
+            return self.max
+        target = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                # ponto médio do bucket, limitado pelos extremos reais
+                value = (self._lower_bound(i) + self._lower_bound(i + 1)) / 2
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def count_above(self, value):
+        """Quantidade de amostras acima de `value` (com resolução de um bucket)."""
+        return sum(self.counts[self._index(value) + 1:])
+
+    def buckets(self):
+        """Retorna (bordas, contagens) do primeiro ao último bucket não vazio, para plotar."""
+        nonzero = [i for i, c in enumerate(self.counts) if c]
+        if not nonzero:
+            return [], []
+        first, last = nonzero[0], nonzero[-1]
+        edges = [self._lower_bound(i) for i in range(first, last + 2)]
+        return edges, list(self.counts[first:last + 1])
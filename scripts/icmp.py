@@ -0,0 +1,38 @@
+# icmp.py
+# Sockets e pacotes ICMP echo compartilhados pela varredura da rede local,
+# pelo ping e pelo traceroute nativo (sem dependência do Streamlit).
+
+import socket
+import struct
+
+ECHO_REQUEST = 8
+ECHO_PAYLOAD = b"infrawatch"
+
+
+def icmp_checksum(data):
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo(ident, seq, payload=ECHO_PAYLOAD):
+    """Echo request ICMP pronto para enviar (seq é truncado para 16 bits)."""
+    seq &= 0xFFFF
+    header = struct.pack("!BBHHH", ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = icmp_checksum(header + payload)
+    return struct.pack("!BBHHH", ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+
+def open_icmp_socket():
+    """
+    Abre socket ICMP: raw (precisa de NET_RAW, concedido no docker-compose) ou,
+    se não houver permissão, o "ping socket" sem privilégio do Linux (SOCK_DGRAM).
+    Retorna (socket, is_raw). Levanta PermissionError se nenhum estiver disponível.
+    """
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), True
+    except PermissionError:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), False
@@ -1,61 +1,216 @@
 # speedtest_gauge.py
 import speedtest
-import streamlit as st
-import plotly.graph_objects as go
+import sqlite3
+import threading
+import time
+
+from scripts.jobs import get_runner, STATUS_LABELS
+
+SERVER_TTL = 6 * 3600             # lista de servidores/melhor servidor valem 6 h
+HISTORY_DB = "speedtest_history.db"
+
+_server_cache = {"best": None, "at": 0.0}
+_server_lock = threading.Lock()
+
+
+def best_server(stt, progress=None):
+    """
+    Servidor de teste com cache por SERVER_TTL (compartilhado no processo).
+    Com cache válido só o servidor escolhido é medido de novo (a latência atual,
+    que vira o ping do teste); sem cache a lista é baixada e os candidatos mais
+    próximos são medidos, como no speedtest-cli.
+    `progress(fase)` recebe "servidores" ao baixar a lista e "ping" ao medir a latência.
+    """
+    with _server_lock:
+        cached = _server_cache["best"]
+        if cached and time.time() - _server_cache["at"] < SERVER_TTL:
+            if progress:
+                progress("ping")
+            try:
+                return stt.get_best_server([dict(cached)])
+            except speedtest.SpeedtestBestServerFailure:
+                pass  # servidor em cache indisponível: refaz a escolha
+        if progress:
+            progress("servidores")
+        stt.get_servers()
+        if progress:
+            progress("ping")
+        best = stt.get_best_server()
+        _server_cache["best"] = dict(best)
+        _server_cache["at"] = time.time()
+        return best
+
+
+# ---- Histórico (SQLite) ----
+def open_history(path=HISTORY_DB):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS results ("
+        "ts REAL PRIMARY KEY, server TEXT, ping REAL, download REAL, upload REAL)"
+    )
+    return conn
+
+
+def save_result(result, path=HISTORY_DB):
+    conn = open_history(path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (result["ts"], result["server"], result["ping"], result["download"], result["upload"]),
+            )
+    finally:
+        conn.close()
+
+
+def history_rows(days=30, path=HISTORY_DB):
+    """(ts, servidor, ping, download, upload) dos últimos `days` dias (a chave primária em ts deixa o filtro barato)."""
+    conn = open_history(path)
+    try:
+        return conn.execute(
+            "SELECT ts, server, ping, download, upload FROM results WHERE ts >= ? ORDER BY ts",
+            (time.time() - days * 86400,),
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def load_history(days=30, path=HISTORY_DB):
+    """Resultados dos últimos `days` dias como DataFrame indexado pelo horário."""
+    import pandas as pd
+    df = pd.DataFrame(history_rows(days, path), columns=["ts", "server", "ping", "download", "upload"])
+    df["ts"] = pd.to_datetime(df["ts"], unit="s")
+    return df.drop(columns="server").set_index("ts")
+
+
+# ---- Teste em background ----
+PHASES = {"servidores": "🛰️ Escolhendo servidor", "ping": "🏓 Ping",
+          "download": "📥 Download", "upload": "📤 Upload"}
+
+
+def speedtest_job(job):
+    """
+    Teste completo (servidor -> ping -> download -> upload) rodando no JobRunner.
+    A fase vai em job.message e o avanço de download/upload em job.progress.
+    Cancelar o job aciona o shutdown_event do speedtest-cli, que interrompe as transferências.
+    """
+    def phase(name, fraction=0.0):
+        job.update(fraction, name)
+
+    def callback(name):
+        def on_request(i, count, start=False, end=False):
+            if end:
+                phase(name, (i + 1) / count)
+        return on_request
+
+    phase("servidores")  # o construtor já baixa a configuração do speedtest.net
+    stt = speedtest.Speedtest(shutdown_event=job.stop)
+    server = best_server(stt, progress=phase)
+    phase("download")
+    download = stt.download(callback=callback("download")) / 1_000_000  # Mbps
+    if job.cancelled:
+        return None
+    phase("upload")
+    upload = stt.upload(callback=callback("upload")) / 1_000_000      # Mbps
+    if job.cancelled:
+        return None
+    result = {
+        "ts": time.time(),
+        "server": f"{server.get('sponsor')} ({server.get('name')})",
+        "ping": stt.results.ping,
+        "download": download,
+        "upload": upload,
+    }
+    save_result(result)
+    return result
+
+
+def speed_gauge(value, title, color, steps):
+    """Velocímetro em Mbps; `steps` são as faixas coloridas [(até, cor), ...]."""
+    import plotly.graph_objects as go
+    ranges, low = [], 0
+    for high, step_color in steps:
+        ranges.append({'range': [low, high], 'color': step_color})
+        low = high
+    return go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=value,
+        title={'text': title},
+        gauge={
+            'axis': {'range': [0, max(100, value * 1.5)]},
+            'bar': {'color': color},
+            'steps': ranges,
+        }
+    ))
+
+
+def show_gauges(download, upload, ping):
+    import streamlit as st
+
+    # Velocímetro de Download
+    fig_download = speed_gauge(download, "📥 Download (Mbps)", "green",
+                               [(20, "lightcoral"), (50, "gold"), (100, "lightgreen")])
+
+    # Velocímetro de Upload
+    fig_upload = speed_gauge(upload, "📤 Upload (Mbps)", "blue",
+                             [(10, "lightcoral"), (30, "gold"), (100, "lightblue")])
+
+    st.plotly_chart(fig_download, use_container_width=True)
+    st.plotly_chart(fig_upload, use_container_width=True)
+
+    st.write(f"🏓 **Ping:** {ping:.2f} ms")
 
 
 def run():
+    import streamlit as st
+
     #st.set_page_config(page_title="Teste de Velocidade", layout="centered")
 
     st.title("📶 Medidor de Velocidade de Internet")
     st.write("Teste sua velocidade de **Download** e **Upload** com velocímetro.")
 
-    if st.button("Iniciar Teste"):
-        st.info("⏳ Testando, aguarde...")
-
-        stt = speedtest.Speedtest()
-        stt.get_best_server()
-
-        # Faz o teste
-        download = stt.download() / 1_000_000  # Mbps
-        upload = stt.upload() / 1_000_000      # Mbps
-        ping = stt.results.ping
-
-        st.success("✅ Teste concluído!")
-
-        # Velocímetro de Download
-        fig_download = go.Figure(go.Indicator(
-            mode="gauge+number",
-            value=download,
-            title={'text': "📥 Download (Mbps)"},
-            gauge={
-                'axis': {'range': [0, max(100, download * 1.5)]},
-                'bar': {'color': "green"},
-                'steps': [
-                    {'range': [0, 20], 'color': "lightcoral"},
-                    {'range': [20, 50], 'color': "gold"},
-                    {'range': [50, 100], 'color': "lightgreen"},
-                ],
-            }
-        ))
-
-        # Velocímetro de Upload
-        fig_upload = go.Figure(go.Indicator(
-            mode="gauge+number",
-            value=upload,
-            title={'text': "📤 Upload (Mbps)"},
-            gauge={
-                'axis': {'range': [0, max(100, upload * 1.5)]},
-                'bar': {'color': "blue"},
-                'steps': [
-                    {'range': [0, 10], 'color': "lightcoral"},
-                    {'range': [10, 30], 'color': "gold"},
-                    {'range': [30, 100], 'color': "lightblue"},
-                ],
-            }
-        ))
-
-        st.plotly_chart(fig_download, use_container_width=True)
-        st.plotly_chart(fig_upload, use_container_width=True)
-
-        st.write(f"🏓 **Ping:** {ping:.2f} ms")
+    job = st.session_state.get("speedtest_job")
+    running = job is not None and job.active
+
+    if st.button("Iniciar Teste", disabled=running):
+        # um único teste por vez no processo: quem pedir durante um teste acompanha o mesmo
+        job = get_runner().submit(speedtest_job, key="speedtest", label="Teste de velocidade")
+        st.session_state["speedtest_job"] = job
+        running = True
+
+    if job is not None:
+        if running:
+            st.info(f"⏳ Testando, aguarde... {PHASES.get(job.message, STATUS_LABELS[job.status])}")
+            st.progress(job.progress)
+            if st.button("Cancelar"):
+                job.cancel()
+        elif job.cancelled:
+            st.warning("Teste cancelado.")
+        elif job.error:
+            st.error(f"Erro no teste: {job.error}")
+        elif job.result:
+            st.success(f"✅ Teste concluído! Servidor: {job.result['server']}")
+            show_gauges(job.result["download"], job.result["upload"], job.result["ping"])
+
+    # ---- Histórico ----
+    st.subheader("📈 Histórico")
+    days = st.select_slider("Período (dias)", options=[1, 7, 30, 90, 365], value=30)
+    try:
+        history = load_history(days)
+    except Exception as e:
+        history = None
+        st.warning(f"Não foi possível ler o histórico: {e}")
+    if history is not None and not history.empty:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.caption("Download / Upload (Mbps)")
+            st.line_chart(history[["download", "upload"]])
+        with col2:
+            st.caption("Ping (ms)")
+            st.line_chart(history[["ping"]])
+    elif history is not None:
+        st.info("Nenhum teste registrado no período.")
+
+    if running:
+        time.sleep(0.5)
+        st.rerun()
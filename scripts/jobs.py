@@ -0,0 +1,172 @@
+# jobs.py
+# Executor de tarefas em segundo plano compartilhado pelo processo inteiro.
+# As páginas enviam o trabalho longo (scan, traceroute e monitoramento do caminho, ping,
+# teste de velocidade, vazão TCP, carga, varredura da rede) e só consultam o estado do
+# job a cada rerun.
+
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 4      # jobs rodando ao mesmo tempo no processo; o resto espera na fila
+RETENTION = 3600     # s que um job terminado continua disponível para consulta
+MAX_FINISHED = 50    # jobs terminados guardados, no máximo
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+STATUS_LABELS = {
+    QUEUED: "⏳ Na fila",
+    RUNNING: "▶️ Rodando",
+    DONE: "✅ Concluído",
+    FAILED: "❌ Erro",
+    CANCELLED: "⏹️ Cancelado",
+}
+
+
+class Job:
+    """
+    Uma tarefa do JobRunner. A função recebe o próprio job para publicar progresso
+    (`update`), itens parciais (`emit`) e checar `stop` (cancelamento).
+    `state` guarda um objeto opcional da ferramenta com os dados ao vivo.
+    """
+
+    def __init__(self, job_id, key, label, state=None):
+        self.id = job_id
+        self.key = key
+        self.label = label
+        self.state = state
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.items = []
+        self.result = None
+        self.error = None
+        self.stop = threading.Event()
+        self.finished_event = threading.Event()
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def cancelled(self):
+        return self.stop.is_set()
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def update(self, progress=None, message=None):
+        if progress is not None:
+            self.progress = min(1.0, max(0.0, progress))
+        if message is not None:
+            self.message = message
+
+    def emit(self, item):
+        """Publica um resultado parcial (lido pela página enquanto o job roda)."""
+        self.items.append(item)
+
+    def cancel(self):
+        self.stop.set()
+
+    def wait(self, timeout=None):
+        return self.finished_event.wait(timeout)
+
+
+class JobRunner:
+    """
+    Pool de threads com fila, limitado a `max_workers` jobs simultâneos no processo.
+    Jobs com a mesma `key` em andamento são deduplicados: quem submete de novo
+    recebe o job existente. Jobs terminados ficam `retention` segundos disponíveis.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, retention=RETENTION, max_finished=MAX_FINISHED):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.retention = retention
+        self.max_finished = max_finished
+        self.jobs = {}       # id -> Job, em ordem de submissão
+        self.in_flight = {}  # key -> Job na fila ou rodando
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, key=None, label=None, state=None, **kwargs):
+        """Agenda fn(job, *args, **kwargs) e devolve o Job (ou o idêntico já em andamento)."""
+        with self.lock:
+            self._prune()
+            if key is not None:
+                job = self.in_flight.get(key)
+                if job is not None and not job.cancelled:
+                    return job
+            job = Job(next(self.ids), key, label or fn.__name__, state)
+            self.jobs[job.id] = job
+            if key is not None:
+                self.in_flight[key] = job
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:  # cancelado ainda na fila
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        status = DONE
+        try:
+            job.result = fn(job, *args, **kwargs)
+            if job.cancelled:
+                status = CANCELLED
+        except Exception as e:
+            job.error = e
+            status = FAILED
+        finally:
+            self._finish(job, status)
+
+    def _finish(self, job, status):
+        with self.lock:
+            job.status = status
+            job.finished = time.time()
+            if job.key is not None and self.in_flight.get(job.key) is job:
+                del self.in_flight[job.key]
+        job.finished_event.set()
+
+    def _prune(self):
+        """Descarta jobs terminados além da retenção (tempo e quantidade)."""
+        finished = [j for j in self.jobs.values() if not j.active]
+        limit = time.time() - self.retention
+        excess = len(finished) - self.max_finished
+        for i, job in enumerate(finished):
+            if i < excess or job.finished < limit:
+                del self.jobs[job.id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self, active_only=False):
+        with self.lock:
+            self._prune()
+            return [j for j in self.jobs.values() if j.active or not active_only]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """JobRunner único do processo (compartilhado por todas as sessões do Streamlit)."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
@@ -1,9 +1,22 @@
-import streamlit as st
 import socket
 import ipaddress
-import subprocess
+import itertools
 import platform
 import psutil
+import asyncio
+import os
+import select
+import sqlite3
+import struct
+import threading
+import time
+
+from scripts.icmp import build_echo, open_icmp_socket
+from scripts.jobs import get_runner, STATUS_LABELS
+
+MAX_HOSTS = 65536  # teto de segurança (um /16)
+ARP_CHUNK = 256  # ARP requests por envio; o cancelamento é checado entre os blocos
+INVENTORY_DB = "network_inventory.db"
 
 def get_local_ip():
     """Descobre o IP local usado para sair para a Internet"""
@@ -15,25 +28,243 @@ def get_local_ip():
         s.close()
     return ip
 
-def ping_host(ip):
-    """Executa ping em um IP e retorna True se responder"""
-    param = "-n" if platform.system().lower() == "windows" else "-c"
-    cmd = ["ping", param, "1", ip]
-    if platform.system().lower() != "windows":
-        cmd.insert(3, "-W")
-        cmd.insert(4, "1")
+def ping_command(ip, timeout=1):
+    """Monta o comando ping de 1 pacote para o SO atual."""
+    if platform.system().lower() == "windows":
+        return ["ping", "-n", "1", "-w", str(int(timeout * 1000)), ip]
+    return ["ping", "-c", "1", "-W", str(int(max(1, timeout))), ip]
+
+async def ping_host_async(ip, timeout=1):
+    """Ping de 1 pacote em subprocesso não bloqueante; True se o host responder."""
+    proc = await asyncio.create_subprocess_exec(
+        *ping_command(ip, timeout),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    return await proc.wait() == 0
+
+async def discover_async(hosts, concurrency=256, timeout=1, on_result=None, stop=None):
+    """
+    Pinga todos os hosts com no máximo `concurrency` subprocessos ao mesmo tempo.
+    `on_result(ip, alive)` é chamado a cada host concluído. Retorna lista de IPs ativos.
+    Se `stop` (threading.Event) for setado, nenhum ping novo é iniciado.
+    """
+    alive = []
+    host_iter = iter(hosts)
+
+    async def worker():
+        for ip in host_iter:
+            if stop is not None and stop.is_set():
+                return
+            ok = await ping_host_async(str(ip), timeout)
+            if ok:
+                alive.append(str(ip))
+            if on_result:
+                on_result(str(ip), ok)
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(hosts)) or 1)))
+    return alive
+
+def icmp_sweep(hosts, timeout=1.0, rate=2000, on_alive=None, stop=None, on_progress=None):
+    """
+    Envia um echo request para cada host a partir de um único socket (até `rate`
+    pacotes/s) e coleta as respostas enquanto envia e por mais `timeout` segundos
+    depois do último envio. Retorna lista de IPs que responderam.
+    Se `stop` (threading.Event) for setado, para de enviar.
+    `on_progress(enviados, total)` é chamado a cada envio.
+    """
+    sock, is_raw = open_icmp_socket()
+    sock.setblocking(False)
+    ident = os.getpid() & 0xFFFF
+    targets = {str(ip) for ip in hosts}
+    alive = []
+
+    def drain(wait):
+        ready, _, _ = select.select([sock], [], [], wait)
+        while ready:
+            try:
+                data, (src, _) = sock.recvfrom(1024)
+            except BlockingIOError:
+                break
+            if is_raw:
+                data = data[(data[0] & 0x0F) * 4:]  # pula o cabeçalho IP
+            # tipo 0 = echo reply; no socket raw conferimos o identificador
+            if len(data) >= 8 and data[0] == 0 and (not is_raw or struct.unpack("!H", data[4:6])[0] == ident):
+                if src in targets:
+                    targets.discard(src)
+                    alive.append(src)
+                    if on_alive:
+                        on_alive(src)
+
+    try:
+        interval = 1.0 / rate
+        next_send = time.monotonic()
+        order = list(targets)
+        for seq, ip in enumerate(order):
+            if stop is not None and stop.is_set():
+                break
+            try:
+                sock.sendto(build_echo(ident, seq), (ip, 0))
+            except OSError:
+                pass  # ex.: host sem rota/broadcast
+            if on_progress:
+                on_progress(seq + 1, len(order))
+            next_send += interval
+            drain(max(0.0, next_send - time.monotonic()))
+        deadline = time.monotonic() + timeout
+        while targets and time.monotonic() < deadline:
+            drain(deadline - time.monotonic())
+    finally:
+        sock.close()
+    return alive
+
+def read_arp_table(path="/proc/net/arp"):
+    """
+    Lê a tabela de vizinhos do kernel (Linux). Retorna {ip: mac} só das entradas
+    completas (flag ATF_COM), ignorando as incompletas (MAC 00:00:00:00:00:00).
+    """
+    table = {}
     try:
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
+        with open(path) as f:
+            next(f, None)  # cabeçalho
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 4 and int(parts[2], 16) & 0x2 and parts[3] != "00:00:00:00:00:00":
+                    table[parts[0]] = parts[3]
+    except OSError:
+        pass
+    return table
+
+def arp_sweep(network, iface=None, timeout=2.0, on_found=None, hosts=None, stop=None, on_progress=None):
+    """
+    Descoberta por ARP na LAN local (precisa de NET_RAW):
+    1. semeia o resultado com a tabela ARP do kernel (/proc/net/arp);
+    2. envia um ARP request para cada endereço da sub-rede (scapy), em blocos de
+       ARP_CHUNK, e coleta as respostas enquanto envia e por mais `timeout` segundos.
+    `hosts` restringe o envio a uma lista de IPs da sub-rede.
+    `on_found(ip, mac)` é chamado para cada dispositivo. Retorna {ip: mac}.
+    Se `stop` (threading.Event) for setado, para de enviar e de esperar.
+    `on_progress(enviados, total)` é chamado a cada bloco enviado.
+    """
+    from scapy.all import ARP, Ether, AsyncSniffer, sendp  # scapy é pesado: importa só quando usado
+
+    found = {}
+    lock = threading.Lock()
+    wanted = {str(ip) for ip in hosts} if hosts is not None else None
+
+    def add(ip, mac):
+        with lock:
+            if found.get(ip) == mac:
+                return
+            found[ip] = mac
+        if on_found:
+            on_found(ip, mac)
+
+    def stopped():
+        return stop is not None and stop.is_set()
+
+    def on_reply(packet):
+        ip = packet[ARP].psrc
+        if ipaddress.IPv4Address(ip) in network and (wanted is None or ip in wanted):
+            add(ip, packet[ARP].hwsrc)
+
+    for ip, mac in read_arp_table().items():
+        if ipaddress.IPv4Address(ip) in network and (wanted is None or ip in wanted):
+            add(ip, mac)
+
+    if wanted is not None and not wanted:
+        return found
+    if wanted is not None:
+        targets, total = iter(sorted(wanted)), len(wanted)
+    else:  # network.hosts() sem contar: /31 e /32 não têm endereços de rede/broadcast
+        targets = (str(ip) for ip in network.hosts())
+        total = network.num_addresses if network.prefixlen >= 31 else network.num_addresses - 2
+    sent = 0
+    listening = threading.Event()
+    sniffer = AsyncSniffer(
+        iface=iface, store=False, started_callback=listening.set,
+        lfilter=lambda p: ARP in p and p[ARP].op == 2, prn=on_reply,
+    )
+    sniffer.start()
+    listening.wait(timeout)  # sem isso as primeiras respostas chegam antes da captura começar
+    try:
+        while not stopped():
+            chunk = list(itertools.islice(targets, ARP_CHUNK))
+            if not chunk:
+                break
+            sendp(Ether(dst="ff:ff:ff:ff:ff:ff") / ARP(pdst=chunk), iface=iface, verbose=False)
+            sent += len(chunk)
+            if on_progress:
+                on_progress(sent, total)
+        deadline = time.monotonic() + timeout
+        while not stopped() and time.monotonic() < deadline:
+            time.sleep(min(0.1, max(0.0, deadline - time.monotonic())))
+    finally:
+        if sniffer.running:
+            sniffer.stop()
+    return found
+
+# ---- Inventário persistente (SQLite) ----
+def open_inventory(path=INVENTORY_DB):
+    """Abre (e cria se necessário) o inventário de hosts da rede local."""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS hosts (
+            ip TEXT PRIMARY KEY,
+            network TEXT NOT NULL,
+            mac TEXT,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            last_probe REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_hosts_network_seen ON hosts(network, last_seen);
+        CREATE INDEX IF NOT EXISTS idx_hosts_mac ON hosts(mac);
+    """)
+    return conn
+
+def record_probe(conn, network, probed, alive, ts):
+    """
+    Atualiza o inventário após sondar `probed` (lista de IPs):
+    - hosts em `alive` ({ip: mac ou None}) entram/atualizam last_seen (MAC só é trocado se conhecido);
+    - hosts já conhecidos que foram sondados e não responderam só têm last_probe atualizado.
+    """
+    with conn:
+        conn.executemany(
+            "INSERT INTO hosts (ip, network, mac, first_seen, last_seen, last_probe) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(ip) DO UPDATE SET network = excluded.network, mac = COALESCE(excluded.mac, hosts.mac), "
+            "last_seen = excluded.last_seen, last_probe = excluded.last_probe",
+            [(ip, str(network), mac, ts, ts, ts) for ip, mac in alive.items()],
         )
-        return result.returncode == 0
-    except FileNotFoundError:
-        st.error("⚠️ O comando 'ping' não está disponível no container/host.")
-        return False
+        known = {r[0] for r in conn.execute("SELECT ip FROM hosts WHERE network = ?", (str(network),))}
+        silent = known.intersection(str(ip) for ip in probed).difference(alive)
+        conn.executemany("UPDATE hosts SET last_probe = ? WHERE ip = ?", [(ts, ip) for ip in silent])
+
+def known_hosts(conn, network, since=None):
+    """IPs do inventário nessa sub-rede (vistos desde `since`), mais recentes primeiro."""
+    sql = "SELECT ip FROM hosts WHERE network = ?"
+    params = [str(network)]
+    if since is not None:
+        sql += " AND last_seen >= ?"
+        params.append(since)
+    return [r[0] for r in conn.execute(sql + " ORDER BY last_seen DESC", params)]
+
+def load_inventory(conn, network):
+    """Inventário da sub-rede como DataFrame (Online = respondeu na última sondagem)."""
+    import pandas as pd
+    df = pd.read_sql_query(
+        "SELECT ip AS IP, mac AS MAC, first_seen AS 'Primeira vez', last_seen AS 'Última vez', "
+        "last_seen >= last_probe AS Online FROM hosts WHERE network = ?",
+        conn, params=(str(network),),
+    )
+    for col in ("Primeira vez", "Última vez"):
+        df[col] = pd.to_datetime(df[col], unit="s")
+    df["Online"] = df["Online"].astype(bool)
+    df["_ip"] = df["IP"].map(lambda ip: int(ipaddress.IPv4Address(ip)))
+    return df.sort_values("_ip").drop(columns="_ip").reset_index(drop=True)
 
 def run():
+    import streamlit as st
     st.header("🔍 Descoberta de Dispositivos na Rede")
 
     # --- IP local ---
@@ -42,10 +273,12 @@ def run():
 
     # --- Detectar sub-rede ---
     network = None
+    net_iface = None
     for iface, addrs in psutil.net_if_addrs().items():
         for addr in addrs:
             if addr.family == socket.AF_INET and addr.address == local_ip:
                 mask = addr.netmask
+                net_iface = iface
                 try:
                     network = ipaddress.IPv4Network(f"{local_ip}/{mask}", strict=False)
                 except Exception as e:
@@ -58,32 +291,164 @@ def run():
 
     st.write(f"🌐 Sub-rede detectada: **{network}**")
 
-    # --- Descoberta de dispositivos ---
-    if st.button("Iniciar varredura"):
-        all_hosts = list(network.hosts())
+    # --- Inventário (estado conhecido, exibido antes de qualquer sondagem) ---
+    conn = open_inventory()
+    try:
+        st.subheader("📒 Inventário")
+        inventory = load_inventory(conn, network)
+        if inventory.empty:
+            st.info("Inventário vazio: rode uma varredura para popular.")
+        else:
+            st.dataframe(inventory, use_container_width=True)
+        discover(conn, network, net_iface)
+    finally:
+        conn.close()
+
+def probe_hosts(method, network, hosts, net_iface, concurrency, rate, on_alive, on_result, stop=None, on_notice=None,
+                on_progress=None):
+    """
+    Sonda `hosts` com o método escolhido. Retorna a mensagem de aviso/erro (ou None).
+    ICMP direto cai para o comando ping se não houver permissão (avisando por `on_notice`).
+    `on_progress(enviados, total)` acompanha o envio no ICMP e no ARP; no comando ping
+    o progresso vem pelo `on_result` de cada host.
+    """
+    if method.startswith("ARP"):
+        try:
+            arp_sweep(network, iface=net_iface, on_found=on_alive, hosts=hosts, stop=stop, on_progress=on_progress)
+        except ImportError:
+            return "⚠️ scapy não está instalado."
+        except OSError as e:
+            return f"⚠️ Não foi possível enviar ARP (requer NET_RAW/root): {e}"
+        return None
+    if method.startswith("ICMP"):
+        try:
+            icmp_sweep(hosts, timeout=1.0, rate=rate, on_alive=on_alive, stop=stop, on_progress=on_progress)
+            return None
+        except OSError as e:
+            if on_notice:
+                on_notice(f"ICMP direto indisponível ({e}); usando o comando ping.")
+    try:
+        asyncio.run(discover_async(hosts, concurrency=concurrency, on_result=on_result, stop=stop))
+    except FileNotFoundError:
+        return "⚠️ O comando 'ping' não está disponível no container/host."
+    return None
+
+def sweep_job(job, network, net_iface, method, phases):
+    """
+    Varredura rodando no JobRunner, fase a fase: os hosts ativos vão para job.state
+    (ip -> linha da tabela), avisos e erros viram itens do job e cada fase concluída
+    é gravada no inventário (uma fase cancelada não é gravada).
+    """
+    results = job.state
+    total = sum(len(p[1]) for p in phases)
+    done = [0]
+    conn = open_inventory()
+    try:
+        for name, hosts, rate, phase_concurrency in phases:
+            if job.cancelled or not hosts:
+                continue
+            job.update(message=f"⏳ Sondando {name} ({len(hosts)} hosts)...")
+            alive = {}
+
+            def on_alive(ip, mac=None):
+                alive[ip] = mac
+                results[ip] = {"IP": ip, "MAC": mac} if mac else {"IP": ip}
+
+            def on_result(ip, ok):
+                done[0] += 1
+                job.update(done[0] / total)
+                if ok:
+                    on_alive(ip)
+
+            done_before = done[0]
+
+            def on_progress(sent, _total):
+                job.update((done_before + sent) / total)
 
-        # Proteção: limitar varredura a /24 (até 254 hosts) para não travar
-        if len(all_hosts) > 256:
+            error = probe_hosts(method, network, hosts, net_iface, phase_concurrency, rate, on_alive, on_result,
+                                stop=job.stop, on_notice=lambda msg: job.emit(("info", msg)), on_progress=on_progress)
+            if error:
+                job.emit(("error", error))
+                break
+            if job.cancelled:
+                break
+            done[0] = done_before + len(hosts)
+            job.update(done[0] / total)
+
+            # grava a fase: o inventário exibido no topo da página já sai atualizado no próximo rerun
+            record_probe(conn, network, hosts, alive, time.time())
+    finally:
+        conn.close()
+    return len(results)
+
+
+def discover(conn, network, net_iface):
+    import streamlit as st
+    st.subheader("🔍 Varredura")
+    method = st.radio(
+        "Método",
+        ["ICMP direto (um socket, sem subprocessos)", "ARP (mesma LAN, retorna MAC)", "Comando ping (subprocessos assíncronos)"],
+        help="ICMP direto usa socket raw (NET_RAW) ou o ping socket do Linux; se não houver permissão, cai para o comando ping. "
+             "ARP encontra também dispositivos que descartam ICMP, mas só no mesmo segmento L2.",
+    )
+    incremental = st.radio(
+        "Modo", ["Incremental (conhecidos primeiro)", "Completa"],
+        help="Incremental: sonda primeiro os hosts vistos recentemente e depois o restante da faixa, em ritmo menor.",
+    ).startswith("Incremental")
+    recent_days = st.number_input("Hosts recentes = vistos nos últimos N dias", min_value=1, value=7, step=1)
+    concurrency = st.number_input("Pings simultâneos (modo comando)", min_value=1, max_value=1024, value=256, step=32)
+
+    if st.button("Iniciar varredura"):
+        # Proteção: limitar varredura a um /16 para não gerar tráfego excessivo
+        # (islice: uma /8 não chega a ser materializada inteira)
+        all_hosts = [str(ip) for ip in itertools.islice(network.hosts(), MAX_HOSTS)]
+        if network.num_addresses - 2 > MAX_HOSTS:  # sem os endereços de rede e broadcast
             st.warning(
-                f"A sub-rede {network} tem {len(all_hosts)} endereços. "
-                f"A varredura foi limitada ao primeiro /24."
+                f"A sub-rede {network} tem {network.num_addresses} endereços. "
+                f"A varredura foi limitada aos primeiros {MAX_HOSTS}."
             )
-            base = str(all_hosts[0]).rsplit(".", 1)[0]
-            all_hosts = [ipaddress.IPv4Address(f"{base}.{i}") for i in range(1, 255)]
-
-        st.write(f"⏳ Varredura em andamento ({len(all_hosts)} hosts)...")
-        progress = st.progress(0)
-        results = []
-
-        for i, ip in enumerate(all_hosts):
-            ip_str = str(ip)
-            if ping_host(ip_str):
-                results.append({"IP": ip_str})
-                st.write(f"✅ Ativo: {ip_str}")
-            progress.progress((i + 1) / len(all_hosts))
-
-        if results:
-            st.success(f"🎯 Dispositivos ativos encontrados: {len(results)}")
-            st.table(results)
+
+        # Fases: (nome, hosts, pps do ICMP, pings simultâneos)
+        concurrency = int(concurrency)
+        if incremental:
+            in_range = set(all_hosts)
+            recent = [ip for ip in known_hosts(conn, network, since=time.time() - recent_days * 86400) if ip in in_range]
+            recent_set = set(recent)
+            rest = [ip for ip in all_hosts if ip not in recent_set]
+            phases = [
+                ("hosts recentes", recent, 2000, concurrency),
+                ("restante da faixa", rest, 500, max(1, concurrency // 4)),
+            ]
         else:
-            st.warning("Nenhum dispositivo ativo encontrado na rede.")
+            phases = [("faixa completa", all_hosts, 2000, concurrency)]
+        # a chave leva tudo que muda o resultado: outra configuração é outro job
+        key = ("sweep", str(network), net_iface, method, incremental, int(recent_days), concurrency)
+        st.session_state["sweep_job"] = get_runner().submit(
+            sweep_job, network, net_iface, method, phases,
+            key=key, label=f"Varredura {network}", state={},
+        )
+
+    job = st.session_state.get("sweep_job")
+    if job is None:
+        return
+    if job.active:
+        st.write(job.message or STATUS_LABELS[job.status])
+        st.progress(job.progress)
+        if st.button("⏹️ Cancelar varredura"):
+            job.cancel()
+    for kind, msg in list(job.items):
+        (st.error if kind == "error" else st.info)(msg)
+
+    results = dict(job.state)
+    if results:
+        st.table(sorted(results.values(), key=lambda r: ipaddress.IPv4Address(r["IP"])))
+    if job.active:
+        time.sleep(0.5)
+        st.rerun()
+    elif job.error:
+        st.error(f"Erro na varredura: {job.error}")
+    elif results:
+        cancelled = " (cancelada)" if job.cancelled else ""
+        st.success(f"🎯 Dispositivos ativos encontrados: {len(results)} em {job.elapsed:.1f}s{cancelled}")
+    else:
+        st.warning("Nenhum dispositivo ativo encontrado na rede.")
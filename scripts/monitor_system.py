@@ -6,9 +6,283 @@ import streamlit as st
 import plotly.graph_objects as go
 import psutil
 import pandas as pd
+import atexit
+import heapq
+import math
+import sqlite3
+import threading
 import time
+from array import array
 
 
+SAMPLE_INTERVAL = 1.0   # segundos entre amostras do sampler
+HISTORY_SIZE = 3600     # amostras mantidas em memória (1 h com intervalo de 1 s)
+PROCESS_EVERY = 2       # varre a tabela de processos a cada N amostras
+PROCESS_TOP_N = 20      # quantos processos manter em cada ranking
+
+METRICS_DB = "metrics_history.db"
+METRICS = ["cpu", "ram", "swap", "temp"]
+FLUSH_EVERY = 10        # grava no disco a cada N amostras
+# (tabela, resolução em s, retenção em s)
+TIERS = [
+    ("metrics_1s", 1, 2 * 86400),
+    ("metrics_1m", 60, 90 * 86400),
+    ("metrics_1h", 3600, 5 * 365 * 86400),
+]
+
+
+# ---- Ring buffer de tamanho fixo ----
+class RingBuffer:
+    """
+    Buffer circular de linhas com `width` floats, guardado em um único array('d').
+    A memória é fixa (capacity * width * 8 bytes); a linha mais antiga é sobrescrita.
+    """
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.width = width
+        self.data = array("d", bytes(8 * capacity * width))
+        self.head = 0      # próxima posição a escrever
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def append(self, row):
+        with self.lock:
+            start = self.head * self.width
+            self.data[start:start + self.width] = array("d", row)
+            self.head = (self.head + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def last(self):
+        with self.lock:
+            if not self.size:
+                return None
+            start = ((self.head - 1) % self.capacity) * self.width
+            return self.data[start:start + self.width].tolist()
+
+    def rows(self, n=None):
+        """Últimas `n` linhas (todas se None), da mais antiga para a mais nova."""
+        with self.lock:
+            n = self.size if n is None else min(n, self.size)
+            first = (self.head - n) % self.capacity
+            if first + n <= self.capacity:
+                flat = self.data[first * self.width:(first + n) * self.width]
+            else:
+                flat = self.data[first * self.width:] + self.data[:self.head * self.width]
+        w = self.width
+        return [flat[i:i + w].tolist() for i in range(0, len(flat), w)]
+
+
+# ---- Coletor de processos (cache persistente + delta de CPU) ----
+class ProcessCollector:
+    """
+    Mantém os objetos psutil.Process entre varreduras, então cpu_percent() é o
+    delta desde a varredura anterior (e não 0.0 como num Process recém-criado).
+    Uma única passada coleta nome, CPU e memória de cada processo (com oneshot())
+    e os top-N saem de um heap, sem montar/ordenar um DataFrame com tudo.
+    """
+
+    def __init__(self):
+        self.procs = {}   # pid -> Process
+
+    def collect(self, top_n=PROCESS_TOP_N):
+        total_mem = psutil.virtual_memory().total
+        seen = {}
+        rows = []
+        for pid in psutil.pids():
+            proc = self.procs.get(pid)
+            try:
+                # is_running() relê o create_time do sistema (o do objeto fica em cache):
+                # False = pid reaproveitado por outro processo, que começa do zero
+                if proc is None or not proc.is_running():
+                    proc = psutil.Process(pid)
+                with proc.oneshot():
+                    cpu = proc.cpu_percent(None)
+                    mem = proc.memory_info().rss * 100 / total_mem
+                    name = proc.name()
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+            seen[pid] = proc
+            rows.append((pid, name, cpu, mem))
+        self.procs = seen
+        return {
+            "memory": heapq.nlargest(top_n, rows, key=lambda r: r[3]),
+            "cpu": heapq.nlargest(top_n, rows, key=lambda r: r[2]),
+        }
+
+
+# ---- Histórico em disco (SQLite) com rollups automáticos ----
+class MetricsStore:
+    """
+    Série temporal local em três camadas: 1 s (valores brutos), 1 min e 1 h
+    (min/avg/max + quantidade de amostras). As camadas grossas são geradas
+    incrementalmente a partir da camada anterior assim que um minuto/hora fecha,
+    e cada camada tem a sua retenção. Consultas longas leem a camada grossa.
+    Só a thread do sampler escreve; as sessões abrem conexões próprias para ler.
+    """
+
+    def __init__(self, path=METRICS_DB):
+        self.path = path
+        self.pending = []
+        self.conn = self._connect()
+        cols_raw = ", ".join(f"{m} REAL" for m in METRICS)
+        cols_agg = ", ".join(f"{m}_min REAL, {m}_avg REAL, {m}_max REAL" for m in METRICS)
+        with self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS metrics_1s (ts INTEGER PRIMARY KEY, {cols_raw})")
+            for table, _, _ in TIERS[1:]:
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (ts INTEGER PRIMARY KEY, n INTEGER, {cols_agg})")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def add(self, ts, values):
+        """Enfileira uma amostra (dict com METRICS); grava a cada FLUSH_EVERY amostras."""
+        self.pending.append((int(ts),) + tuple(values[m] for m in METRICS))
+        if len(self.pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        rows, self.pending = self.pending, []
+        placeholders = ", ".join("?" * (len(METRICS) + 1))
+        with self.conn:
+            if rows:
+                self.conn.executemany(f"INSERT OR REPLACE INTO metrics_1s VALUES ({placeholders})", rows)
+            self._rollup(time.time())
+
+    def _rollup(self, now):
+        # 1 s -> 1 min: agrega valores brutos
+        raw = ", ".join(f"MIN({m}), AVG({m}), MAX({m})" for m in METRICS)
+        # 1 min -> 1 h: média ponderada pela quantidade de amostras
+        agg = ", ".join(f"MIN({m}_min), SUM({m}_avg * n) / SUM(n), MAX({m}_max)" for m in METRICS)
+        for (src, _, _), (dst, step, _) in zip(TIERS, TIERS[1:]):
+            select = raw if src == "metrics_1s" else agg
+            count = "COUNT(*)" if src == "metrics_1s" else "SUM(n)"
+            last = self.conn.execute(f"SELECT MAX(ts) FROM {dst}").fetchone()[0]
+            start = last + step if last is not None else 0
+            end = int(now // step) * step   # só intervalos já fechados
+            if end > start:
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO {dst} "
+                    f"SELECT (ts / {step}) * {step}, {count}, {select} FROM {src} "
+                    f"WHERE ts >= ? AND ts < ? GROUP BY ts / {step}",
+                    (start, end),
+                )
+        for table, _, retention in TIERS:
+            self.conn.execute(f"DELETE FROM {table} WHERE ts < ?", (int(now - retention),))
+
+    def query(self, seconds, max_points=4000):
+        """
+        Últimos `seconds` segundos, lidos da camada mais fina que caiba em
+        `max_points` linhas. Retorna (DataFrame indexado por ts, resolução em s).
+        """
+        since = int(time.time() - seconds)
+        for table, step, retention in TIERS:
+            if seconds / step <= max_points and seconds <= retention:
+                break
+        conn = self._connect()
+        try:
+            df = pd.read_sql_query(f"SELECT * FROM {table} WHERE ts >= ? ORDER BY ts", conn, params=(since,))
+        finally:
+            conn.close()
+        df["ts"] = pd.to_datetime(df["ts"], unit="s")
+        return df.set_index("ts"), step
+
+
+# ---- Sampler em background (um por processo do servidor) ----
+class SystemSampler:
+    """
+    Thread que coleta CPU (total e por núcleo), RAM, swap e temperatura a cada
+    `interval` segundos e grava em um RingBuffer (e no MetricsStore, sem os
+    núcleos). Todas as sessões leem do mesmo buffer, então o custo não cresce
+    com o número de abas abertas.
+    Colunas: ts, cpu, ram, swap, temp, core0..coreN.
+    Uma falha na coleta não derruba a thread: fica em `last_error` (instante,
+    mensagem) para a página mostrar. Ao encerrar o processo, as amostras ainda
+    não gravadas vão para o disco.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, capacity=HISTORY_SIZE, store_path=METRICS_DB):
+        self.interval = interval
+        self.cores = psutil.cpu_count(logical=True) or 1
+        self.columns = ["ts", "cpu", "ram", "swap", "temp"] + [f"core{i}" for i in range(self.cores)]
+        self.buffer = RingBuffer(capacity, len(self.columns))
+        self.temps = []   # última leitura de sensores: [(sensor, label, °C)]
+        self.processes = ProcessCollector()
+        self.top = {"memory": [], "cpu": []}
+        self.store = MetricsStore(store_path) if store_path else None
+        self.last_error = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="system-sampler", daemon=True)
+        psutil.cpu_percent(percpu=True)  # primeira chamada só arma o delta
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _read_temps(self):
+        try:
+            temps = psutil.sensors_temperatures()
+        except (AttributeError, OSError):
+            return []
+        return [
+            (name, entry.label or "CPU", round(entry.current, 1))
+            for name, entries in (temps or {}).items()
+            for entry in entries
+            if entry.current
+        ]
+
+    def sample(self):
+        per_core = psutil.cpu_percent(percpu=True)
+        cpu = sum(per_core) / len(per_core) if per_core else 0.0
+        temps = self._read_temps()
+        self.temps = temps
+        temp = max(t[2] for t in temps) if temps else math.nan
+        row = [time.time(), cpu, psutil.virtual_memory().percent, psutil.swap_memory().percent, temp]
+        row += (per_core + [math.nan] * self.cores)[:self.cores]
+        self.buffer.append(row)
+        if self.store:
+            self.store.add(row[0], dict(zip(self.columns[1:5], row[1:5])))
+
+    def _loop(self):
+        next_at = time.monotonic()
+        tick = 0
+        while not self.stopped.is_set():
+            try:
+                self.sample()
+                if tick % PROCESS_EVERY == 0:
+                    self.top = self.processes.collect()
+            except Exception as e:
+                self.last_error = (time.time(), f"{type(e).__name__}: {e}")
+            tick += 1
+            next_at += self.interval
+            self.stopped.wait(max(0.0, next_at - time.monotonic()))
+
+    def close(self):
+        """Para a coleta e grava no disco as amostras pendentes (até FLUSH_EVERY - 1)."""
+        self.stopped.set()
+        self.thread.join(timeout=self.interval + 5)
+        if self.store:
+            try:
+                self.store.flush()
+            except Exception as e:
+                self.last_error = (time.time(), f"{type(e).__name__}: {e}")
+
+    def latest(self):
+        row = self.buffer.last()
+        return dict(zip(self.columns, row)) if row else None
+
+    def history(self, seconds=None):
+        n = None if seconds is None else int(seconds / self.interval)
+        df = pd.DataFrame(self.buffer.rows(n), columns=self.columns)
+        df["ts"] = pd.to_datetime(df["ts"], unit="s")
+        return df.set_index("ts")
+
+
+@st.cache_resource
+def get_sampler():
+    """Um único sampler por processo do servidor, compartilhado por todas as sessões."""
+    return SystemSampler()
+
 
 # ---- Função para criar gauges ----
 def gauge_plot(value, titulo, max_val=100, unidade="%"):
@@ -33,22 +307,14 @@ def gauge_plot(value, titulo, max_val=100, unidade="%"):
 
 # ---- Função para pegar top processos ----
 def get_top_processes(metric="memory", top_n=5):
-    processes = []
-    for p in psutil.process_iter(attrs=["pid", "name", "cpu_percent", "memory_percent"]):
-        try:
-            info = p.info
-            processes.append(info)
-        except psutil.NoSuchProcess:
-            continue
-
-    df = pd.DataFrame(processes)
+    """Top-N processos por memória ou CPU, a partir da última varredura do sampler."""
+    rows = get_sampler().top["memory" if metric == "memory" else "cpu"][:top_n]
+    df = pd.DataFrame(rows, columns=["pid", "name", "cpu_percent", "memory_percent"])
 
     if metric == "memory":
-        df = df.sort_values("memory_percent", ascending=False).head(top_n)
         df["memory_percent"] = df["memory_percent"].round(2)
         return df[["pid", "name", "memory_percent"]].rename(columns={"memory_percent": "Mem %"})
     else:
-        df = df.sort_values("cpu_percent", ascending=False).head(top_n)
         df["cpu_percent"] = df["cpu_percent"].round(2)
         return df[["pid", "name", "cpu_percent"]].rename(columns={"cpu_percent": "CPU %"})
 
@@ -60,46 +326,90 @@ def run():
 
     REFRESH_INTERVAL = st.sidebar.number_input("Intervalo de atualização (segundos)", 1, 10, 2)
 
+    sampler = get_sampler()
+    latest = sampler.latest()
+    if latest is None:
+        # primeira visita após subir o servidor: aguarda a primeira amostra
+        time.sleep(sampler.interval)
+        latest = sampler.latest()
+        if latest is None:
+            st.info("⏳ Coletando a primeira amostra...")
+            time.sleep(REFRESH_INTERVAL)
+            st.rerun()
+
+    if sampler.last_error:
+        when, message = sampler.last_error
+        st.warning(f"⚠️ Última falha do coletor ({time.strftime('%H:%M:%S', time.localtime(when))}): {message}")
+
     # ---- Layout ----
     col1, col2 = st.columns(2)
 
     # ----- RAM -----
     with col1:
-        mem = psutil.virtual_memory()
-        ram_percent = mem.percent
         st.subheader("💾 Memória RAM")
-        st.plotly_chart(gauge_plot(ram_percent, "Uso de RAM"), use_container_width=True)
+        st.plotly_chart(gauge_plot(latest["ram"], "Uso de RAM"), use_container_width=True)
 
         st.write("Top 5 processos que mais consomem RAM:")
         st.dataframe(get_top_processes("memory"))
 
     # ----- CPU -----
     with col2:
-        cpu_percent = psutil.cpu_percent(interval=1)
         st.subheader("⚙️ CPU")
-        st.plotly_chart(gauge_plot(cpu_percent, "Uso de CPU"), use_container_width=True)
+        st.plotly_chart(gauge_plot(latest["cpu"], "Uso de CPU"), use_container_width=True)
 
         st.write("Top 5 processos que mais consomem CPU:")
         st.dataframe(get_top_processes("cpu"))
 
 
-    # ----- Temperatura -----
     # ----- Temperatura -----
     st.subheader("🌡️ Temperatura do Processador")
 
-    try:
-        temps = psutil.sensors_temperatures()
-        if not temps:
-            st.warning("⚠️ Não foi possível coletar temperatura neste sistema.")
+    if not sampler.temps:
+        st.warning("⚠️ Não foi possível coletar temperatura neste sistema.")
+    else:
+        for name, label, temp_val in sampler.temps:
+            st.plotly_chart(gauge_plot(temp_val, f"{name} ({label})", max_val=100, unidade="°C"), use_container_width=True)
+
+
+    # ----- Histórico -----
+    st.subheader("📈 Histórico")
+    windows = {
+        "1 min": 60, "5 min": 300, "15 min": 900, "1 h": 3600,
+        "24 h": 86400, "7 dias": 7 * 86400, "30 dias": 30 * 86400,
+    }
+    label = st.select_slider("Janela", options=list(windows.keys()), value="5 min")
+    window = windows[label]
+    if window <= HISTORY_SIZE * sampler.interval:
+        # janelas curtas: ring buffer em memória (com núcleos individuais)
+        hist = sampler.history(window)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.caption("CPU total e por núcleo (%)")
+            st.line_chart(hist[["cpu"] + [c for c in hist.columns if c.startswith("core")]])
+        with col2:
+            st.caption("RAM e swap (%)")
+            st.line_chart(hist[["ram", "swap"]])
+        if hist["temp"].notna().any():
+            st.caption("Temperatura máxima (°C)")
+            st.line_chart(hist[["temp"]])
+    elif sampler.store is None:
+        st.info("Histórico em disco desativado.")
+    else:
+        # janelas longas: camada agregada do histórico em disco (min/avg/max)
+        hist, step = sampler.store.query(window)
+        st.caption(f"Fonte: `{METRICS_DB}` — resolução de {step} s ({len(hist)} pontos)")
+        if hist.empty:
+            st.info("Ainda não há histórico suficiente para essa janela.")
         else:
-            # Pega o primeiro sensor disponível (ex: 'coretemp')
-            for name, entries in temps.items():
-                for entry in entries:
-                    if entry.current:  # valor atual
-                        temp_val = round(entry.current, 1)
-                        st.plotly_chart(gauge_plot(temp_val, f"{name} ({entry.label or 'CPU'})", max_val=100, unidade="°C"), use_container_width=True)
-    except Exception as e:
-        st.error(f"Erro ao coletar temperatura: {e}")
+            titles = {"cpu": "CPU (%)", "ram": "RAM (%)", "swap": "Swap (%)", "temp": "Temperatura (°C)"}
+            col1, col2 = st.columns(2)
+            for i, metric in enumerate(METRICS):
+                cols = [metric] if step == 1 else [f"{metric}_min", f"{metric}_avg", f"{metric}_max"]
+                if hist[cols].isna().all().all():
+                    continue
+                with (col1 if i % 2 == 0 else col2):
+                    st.caption(titles[metric])
+                    st.line_chart(hist[cols])
 
 
     # ---- Atualização automática ----
@@ -1,39 +1,348 @@
-import streamlit as st
 import subprocess
 import platform
+import math
+import random
+import re
+import select
+import socket
+import struct
+import threading
+import time
+from array import array
+
+from scripts.icmp import build_echo, open_icmp_socket
+from scripts.jobs import get_runner, QUEUED
+
+MAX_PACKETS = 100000
+CHART_POINTS = 300
+REPLY_RE = re.compile(r"(?:icmp_seq|seq)=(\d+).*?time[=<]([\d.]+)")
+TRANSMITTED_RE = re.compile(r"(\d+) packets transmitted")
+# o iputils ("56(84) bytes of data") numera a partir de 1; BSD/macOS, busybox e inetutils
+# ("56 data bytes") a partir de 0
+IPUTILS_BANNER = "bytes of data"
+
+
+class PingStats:
+    """
+    Estatísticas de um alvo: RTT de cada pacote em um array('d') compacto
+    (NaN = sem resposta) e somas acumuladas para min/avg/max/mdev sem reler o array.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.address = None
+        self.error = None
+        self.rtts = array("d")
+        self.received = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def sent(self):
+        return len(self.rtts)
+
+    def add_sent(self, n=1):
+        with self.lock:
+            self.rtts.extend([math.nan] * n)
+
+    def sent_at_least(self, n):
+        """Garante `n` pacotes enviados (os novos ficam sem resposta até ela chegar)."""
+        with self.lock:
+            if n > len(self.rtts):
+                self.rtts.extend([math.nan] * (n - len(self.rtts)))
+
+    def add_reply(self, index, rtt):
+        with self.lock:
+            if index >= len(self.rtts):
+                self.rtts.extend([math.nan] * (index + 1 - len(self.rtts)))
+            if not math.isnan(self.rtts[index]):
+                return  # resposta duplicada
+            self.rtts[index] = rtt
+            self.received += 1
+            self.total += rtt
+            self.total_sq += rtt * rtt
+            self.min = min(self.min, rtt)
+            self.max = max(self.max, rtt)
+
+    def row(self):
+        with self.lock:
+            n, sent = self.received, self.sent
+            avg = self.total / n if n else None
+            mdev = math.sqrt(max(0.0, self.total_sq / n - avg * avg)) if n else None
+            return {
+                "Alvo": self.target,
+                "IP": self.address,
+                "Enviados": sent,
+                "Recebidos": n,
+                "Perda %": round(100 * (sent - n) / sent, 1) if sent else 0.0,
+                "Min (ms)": round(self.min, 2) if n else None,
+                "Avg (ms)": round(avg, 2) if n else None,
+                "Max (ms)": round(self.max, 2) if n else None,
+                "Mdev (ms)": round(mdev, 2) if n else None,
+                "Erro": self.error,
+            }
+
+    def tail(self, n=CHART_POINTS):
+        """Últimos `n` RTTs (índice = número do pacote)."""
+        import pandas as pd
+        with self.lock:
+            start = max(0, len(self.rtts) - n)
+            return pd.Series(self.rtts[start:].tolist(), index=range(start, len(self.rtts)), name=self.target)
+
+
+def resolve_targets(stats):
+    """
+    Resolve o IPv4 de cada alvo ainda sem endereço. Um nome que não resolve fica
+    com `error` preenchido e de fora do ping, sem derrubar os demais.
+    Retorna os alvos prontos para pingar.
+    """
+    ready = []
+    for st_ in stats:
+        if st_.address is None and st_.error is None:
+            try:
+                st_.address = socket.gethostbyname(st_.target)
+            except OSError as e:
+                st_.error = f"falha ao resolver: {e}"
+        if st_.address is not None:
+            ready.append(st_)
+    return ready
+
+
+def icmp_ping(stats, count, interval=1.0, timeout=1.0, stop=None):
+    """
+    Pinga todos os alvos a partir de um único socket ICMP (raw ou ping socket do Linux):
+    a cada `interval` segundos envia um echo para cada alvo, até `count` rodadas.
+    As respostas são casadas pelo número de sequência (e origem); pacotes sem resposta
+    ficam como NaN e entram na perda.
+    """
+    sock, is_raw = open_icmp_socket()
+    sock.setblocking(False)
+    ident = random.randrange(1, 0xFFFF)
+    stats = resolve_targets(stats)
+    in_flight = {}  # seq -> (stats, rodada, instante de envio)
+    seq = 0
+
+    def receive(wait):
+        ready, _, _ = select.select([sock], [], [], max(0.0, wait))
+        now = time.perf_counter()
+        while ready:
+            try:
+                data, (src, _) = sock.recvfrom(2048)
+            except BlockingIOError:
+                break
+            if is_raw:
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8 or data[0] != 0:
+                continue
+            reply_ident, reply_seq = struct.unpack("!HH", data[4:8])
+            if is_raw and reply_ident != ident:
+                continue
+            probe = in_flight.pop(reply_seq, None)
+            if probe and probe[0].address == src:
+                probe[0].add_reply(probe[1], (now - probe[2]) * 1000)
+
+    try:
+        next_round = time.perf_counter()
+        for rnd in range(count):
+            if stop is not None and stop.is_set():
+                break
+            for st_ in stats:
+                st_.add_sent()
+                try:
+                    sock.sendto(build_echo(ident, seq), (st_.address, 0))
+                    in_flight[seq] = (st_, rnd, time.perf_counter())
+                except OSError:
+                    pass
+                seq = (seq + 1) & 0xFFFF
+            next_round += interval
+            # recebe até a próxima rodada; descarta o que passou do timeout
+            while time.perf_counter() < next_round:
+                receive(next_round - time.perf_counter())
+            limit = time.perf_counter() - timeout
+            for key in [k for k, v in in_flight.items() if v[2] < limit]:
+                del in_flight[key]
+        deadline = time.perf_counter() + timeout
+        while in_flight and time.perf_counter() < deadline:
+            receive(deadline - time.perf_counter())
+    finally:
+        sock.close()
+
+
+def ping_command_line(address, count, interval=1.0, timeout=1.0):
+    """Linha de comando do `ping` do sistema para um alvo (as opções mudam por plataforma)."""
+    system = platform.system().lower()
+    if system == "windows":
+        return ["ping", "-n", str(count), "-w", str(max(1, round(timeout * 1000))), address]
+    cmd = ["ping", "-c", str(count)]
+    if interval != 1.0:
+        cmd += ["-i", str(interval)]
+    # -W: milissegundos no macOS, segundos inteiros no iputils/busybox
+    cmd += ["-W", str(max(1, round(timeout * 1000))) if system == "darwin" else str(max(1, math.ceil(timeout)))]
+    return cmd + [address]
+
+
+def command_ping(stats, count, interval=1.0, timeout=1.0, stop=None):
+    """
+    Alternativa sem socket ICMP: um `ping` do sistema por alvo, em paralelo,
+    com o RTT de cada linha de resposta parseado para o array do alvo.
+    Enquanto rodam, os enviados avançam pelo relógio (um a cada `interval`), então a
+    perda parcial já aparece; a linha "packets transmitted" do fim dá o número exato.
+    Falhas de um alvo (ex.: comando ausente) ficam no `error` dele.
+    """
+    stats = resolve_targets(stats)
+    started = time.perf_counter()
+    procs = {}  # alvo -> processo, para o laço abaixo encerrar no `stop`
+
+    def sent_by_clock():
+        return min(count, int((time.perf_counter() - started) / interval) + 1)
+
+    def one(st_):
+        try:
+            proc = subprocess.Popen(ping_command_line(st_.address, count, interval, timeout),
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        except OSError as e:
+            st_.error = f"falha ao executar ping: {e}"
+            return
+        procs[st_.target] = proc
+        first_seq = 1 if platform.system().lower() == "linux" else 0
+        try:
+            for line in proc.stdout:
+                if line.startswith("PING "):
+                    first_seq = 1 if IPUTILS_BANNER in line else 0
+                    continue
+                m = REPLY_RE.search(line)
+                if m:
+                    if int(m.group(1)) >= first_seq:
+                        st_.add_reply(int(m.group(1)) - first_seq, float(m.group(2)))
+                    continue
+                m = TRANSMITTED_RE.search(line)
+                if m:
+                    st_.sent_at_least(int(m.group(1)))
+            if stop is not None and stop.is_set():
+                # encerrado sem o resumo final: os que estavam sem resposta contam como perdidos
+                st_.sent_at_least(sent_by_clock())
+        except Exception as e:
+            st_.error = f"{type(e).__name__}: {e}"
+        finally:
+            if proc.poll() is None:
+                proc.terminate()
+            proc.wait()
+            proc.stdout.close()
+
+    threads = [threading.Thread(target=one, args=(st_,), daemon=True) for st_ in stats]
+    for t in threads:
+        t.start()
+    # o ping só escreve quando chega resposta: o relógio avança os enviados dos que seguem rodando
+    # (menos o pacote da rodada atual, que ainda pode estar em voo)
+    while True:
+        alive = [(st_, t) for st_, t in zip(stats, threads) if t.is_alive()]
+        if not alive:
+            break
+        for st_, _ in alive:
+            if stop is not None and stop.is_set():
+                proc = procs.get(st_.target)
+                if proc is not None and proc.poll() is None:
+                    proc.terminate()
+            else:
+                st_.sent_at_least(sent_by_clock() - 1)
+        alive[0][1].join(min(interval, 0.5))
+
+
+def ping_targets(stats, count, interval=1.0, timeout=1.0, stop=None, on_engine=None):
+    """
+    Pinga os alvos pelo socket ICMP e, sem permissão para ele, pelo comando `ping`.
+    `on_engine(nome)` é avisado antes de cada motor começar. Retorna o motor usado.
+    """
+    if on_engine:
+        on_engine("ICMP")
+    try:
+        icmp_ping(stats, count, interval, timeout, stop)
+        return "ICMP"
+    except PermissionError:
+        pass
+    if on_engine:
+        on_engine("comando ping")
+    command_ping(stats, count, interval, timeout, stop)
+    return "comando ping"
+
+
+class PingSession:
+    """
+    Estado de um ping de vários alvos (estatísticas ao vivo e motor usado).
+    Roda no JobRunner (`execute`); a página guarda o job e só lê este estado.
+    """
+
+    def __init__(self, targets, count, interval, timeout):
+        self.stats = [PingStats(t) for t in targets]
+        self.count = count
+        self.interval = interval
+        self.timeout = timeout
+        self.engine = None
+
+    def execute(self, job):
+        return ping_targets(self.stats, self.count, self.interval, self.timeout, job.stop,
+                            on_engine=lambda engine: setattr(self, "engine", engine))
 
 
 def run():
+    import streamlit as st
+    import pandas as pd
     st.header("📡 Ferramenta de Ping")
 
     # Entrada do usuário
-    host = st.text_input("Digite o endereço (IP ou domínio):", "8.8.8.8")
-    count = st.number_input("Quantidade de pacotes:", min_value=1, max_value=20, value=4)
-
-    if st.button("Iniciar Ping"):
-        st.write(f"🔍 Rodando ping em **{host}** com {count} pacotes...")
+    targets_input = st.text_area("Endereços (IP ou domínio, um por linha):", "8.8.8.8\n1.1.1.1")
+    count = st.number_input("Quantidade de pacotes por alvo:", min_value=1, max_value=MAX_PACKETS, value=4)
+    interval = st.number_input("Intervalo entre pacotes (s):", min_value=0.2, max_value=10.0, value=1.0, step=0.1)
+    timeout = st.number_input("Timeout por pacote (s):", min_value=0.1, max_value=10.0, value=1.0, step=0.1)
 
-        # Monta comando de acordo com o SO
-        param = "-n" if platform.system().lower() == "windows" else "-c"
-        cmd = ["ping", param, str(count), host]
+    job = st.session_state.get("ping_job")
+    running = job is not None and job.active
 
-        try:
-            # Executa comando e captura saída
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Iniciar Ping", disabled=running):
+            targets = list(dict.fromkeys(t.strip() for t in targets_input.splitlines() if t.strip()))
+            if not targets:
+                st.error("Nenhum alvo informado.")
+                return
+            session = PingSession(targets, int(count), float(interval), float(timeout))
+            job = get_runner().submit(
+                session.execute, key=("ping", tuple(targets), int(count), float(interval), float(timeout)),
+                label=f"Ping de {len(targets)} alvo(s)", state=session,
+            )
+            st.session_state["ping_job"] = job
+            running = True
+    with col2:
+        if st.button("Parar", disabled=not running):
+            job.cancel()
 
-            output_area = st.empty()
-            logs = ""
+    if job is None:
+        return
+    session = job.state
 
-            for line in iter(process.stdout.readline, ""):
-                if not line:
-                    break
-                logs += line
-                output_area.text(logs)
+    if job.status == QUEUED:
+        st.info("⏳ Na fila: o limite de tarefas simultâneas do servidor foi atingido.")
+    elif running:
+        st.write(f"🔍 Rodando ping em **{len(session.stats)}** alvo(s)...")
+    elif job.error:
+        st.error(f"Erro ao rodar ping: {job.error}")
+    elif any(s.error for s in session.stats):
+        st.warning("Ping finalizado com erro em parte dos alvos (coluna Erro).")
+    else:
+        st.success("✅ Ping finalizado.")
 
-            process.stdout.close()
-            process.wait()
+    st.dataframe(pd.DataFrame([s.row() for s in session.stats]), use_container_width=True)
+    if session.engine:
+        st.caption(f"Motor: {session.engine}")
 
-            st.success("✅ Ping finalizado.")
+    chart = pd.concat([s.tail() for s in session.stats], axis=1)
+    if not chart.empty:
+        st.caption(f"RTT por pacote (ms) — últimos {CHART_POINTS}")
+        st.line_chart(chart)
 
-        except Exception as e:
-            st.error(f"Erro ao rodar ping: {e}")
+    if running:
+        time.sleep(max(0.5, min(float(interval), 2.0)))
+        st.rerun()
@@ -4,13 +4,13 @@
 #   pip install streamlit
 #   streamlit run scanner_app.py
 
-import streamlit as st
 import socket
-import concurrent.futures
-from datetime import datetime
-import pandas as pd
+import asyncio
+import sqlite3
 import time
 
+from scripts.jobs import get_runner, STATUS_LABELS
+
 
 # ---- Funções utilitárias ----
 def parse_ports(ports_str):
@@ -42,35 +42,335 @@ def parse_ports(ports_str):
                     ports.add(p)
     return sorted(ports)
 
-def scan_port(target, port, timeout=1.0):
-    """Tenta conectar na porta TCP; retorna (port, True/False)."""
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(timeout)
+def raise_nofile_limit():
+    """
+    Sobe o limite soft de descritores abertos até o hard limit (Unix).
+    Milhares de connects simultâneos precisam de um socket cada.
+    Retorna o limite efetivo (ou None se não for possível consultar).
+    """
     try:
-        s.connect((target, port))
-        s.close()
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            pass
+    return soft
+
+async def resolve_target(target):
+    """
+    Resolve o host uma única vez; retorna (family, address), preferindo IPv4
+    (o primeiro resultado pode ser um IPv6 sem rota em hosts dual-stack).
+    Hosts só com IPv6 usam o primeiro endereço IPv6.
+    """
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(target, None, type=socket.SOCK_STREAM)
+    family, _, _, _, sockaddr = next((i for i in infos if i[0] == socket.AF_INET), infos[0])
+    return family, sockaddr[0]
+
+async def probe_port(family, address, port, timeout=1.0):
+    """Connect TCP não bloqueante; retorna (port, True/False)."""
+    loop = asyncio.get_running_loop()
+    s = socket.socket(family, socket.SOCK_STREAM)
+    s.setblocking(False)
+    try:
+        await asyncio.wait_for(loop.sock_connect(s, (address, port)), timeout)
         return (port, True)
-    except Exception:
+    except (OSError, asyncio.TimeoutError):
         return (port, False)
+    finally:
+        s.close()
+
+async def scan_target_async(target, ports, timeout=1.0, concurrency=1000, sem=None, on_result=None, stop=None):
+    """
+    Escaneia as portas de um target com asyncio.
+    `concurrency` workers consomem a lista de portas, então nunca há mais que
+    `concurrency` connects em voo (e no máximo esse número de corrotinas vivas).
+    Se `sem` for informado, cada connect também precisa de uma vaga nele
+    (orçamento global compartilhado entre vários hosts).
+    `on_result(target, port, is_open)` é chamado a cada porta concluída.
+    Se `stop` (threading.Event) for setado, os workers param antes da próxima porta.
+    Retorna lista de (port, is_open) na ordem de conclusão.
+    """
+    family, address = await resolve_target(target)
+    results = []
+    port_iter = iter(ports)
 
-def scan_target(target, ports, timeout=1.0, max_workers=100):
+    async def worker():
+        for port in port_iter:
+            if stop is not None and stop.is_set():
+                return
+            if sem is not None:
+                async with sem:
+                    result = await probe_port(family, address, port, timeout)
+            else:
+                result = await probe_port(family, address, port, timeout)
+            results.append(result)
+            if on_result:
+                on_result(target, *result)
+
+    workers = min(concurrency, len(ports)) if len(ports) > 0 else 1
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return results
+
+def effective_limit(requested):
+    """Limita o número de connects em voo ao que o RLIMIT_NOFILE permite."""
+    limit = raise_nofile_limit()
+    if limit:
+        # deixa folga para os descritores já abertos pelo processo (Streamlit, logs...)
+        return max(1, min(requested, limit - 64))
+    return requested
+
+def scan_target(target, ports, timeout=1.0, max_workers=1000):
     """Escaneia todas as portas fornecidas para um único target, retornando lista de portas abertas."""
-    open_ports = []
-    # limitar threads para evitar estouro
-    workers = min(max_workers, len(ports)) if len(ports) > 0 else 1
-    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
-        futures = [ex.submit(scan_port, target, p, timeout) for p in ports]
-        for f in concurrent.futures.as_completed(futures):
-            try:
-                port, is_open = f.result()
-                if is_open:
-                    open_ports.append(port)
-            except Exception:
-                continue
-    return sorted(open_ports)
+    max_workers = effective_limit(max_workers)
+    results = asyncio.run(scan_target_async(target, ports, timeout=timeout, concurrency=max_workers))
+    return sorted(port for port, is_open in results if is_open)
+
+async def scan_targets_async(targets, ports, timeout=1.0, global_limit=2000, per_host_limit=500, on_result=None, stop=None):
+    """
+    Escaneia todos os targets ao mesmo tempo.
+    `global_limit` é o total de connects em voo somando todos os hosts;
+    `per_host_limit` é o máximo de connects simultâneos contra um mesmo host.
+    Retorna dict {target: lista de portas abertas} e dict {target: erro}.
+    """
+    sem = asyncio.Semaphore(global_limit)
+    open_ports = {}
+    errors = {}
+
+    async def one(tgt):
+        try:
+            results = await scan_target_async(
+                tgt, ports, timeout=timeout, concurrency=per_host_limit, sem=sem, on_result=on_result, stop=stop
+            )
+            open_ports[tgt] = sorted(port for port, is_open in results if is_open)
+        except Exception as e:
+            open_ports[tgt] = []
+            errors[tgt] = e
+
+    await asyncio.gather(*(one(tgt) for tgt in targets))
+    return open_ports, errors
+
+def scan_targets(targets, ports, timeout=1.0, global_limit=2000, per_host_limit=500, on_result=None, stop=None):
+    """Versão síncrona de scan_targets_async (respeitando o limite de descritores)."""
+    global_limit = effective_limit(global_limit)
+    per_host_limit = min(per_host_limit, global_limit)
+    return asyncio.run(scan_targets_async(
+        targets, ports, timeout=timeout, global_limit=global_limit,
+        per_host_limit=per_host_limit, on_result=on_result, stop=stop,
+    ))
+
+
+# ---- Histórico de scans (SQLite, append-only) ----
+SCAN_DB = "scan_history.db"
+
+SCAN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    ports_spec TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scan_hosts (
+    scan_id INTEGER NOT NULL REFERENCES scans(id),
+    host TEXT NOT NULL,
+    ts REAL NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS open_ports (
+    scan_id INTEGER NOT NULL REFERENCES scans(id),
+    host TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scan_hosts_host_ts ON scan_hosts(host, ts);
+CREATE INDEX IF NOT EXISTS idx_open_ports_host_ts ON open_ports(host, ts);
+CREATE INDEX IF NOT EXISTS idx_open_ports_port_ts ON open_ports(port, ts);
+"""
+
+def open_store(path=SCAN_DB):
+    """Abre (e cria se necessário) o banco de histórico de scans."""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCAN_SCHEMA)
+    return conn
+
+def save_scan(conn, started_at, finished_at, ports_spec, open_ports_by_host, errors=None):
+    """
+    Grava um scan: uma linha por host escaneado e uma linha por host/porta aberta.
+    Só faz INSERT, então o custo é proporcional ao scan atual e não ao histórico.
+    Retorna o id do scan.
+    """
+    errors = errors or {}
+    ts = finished_at
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO scans (started_at, finished_at, ports_spec) VALUES (?, ?, ?)",
+            (started_at, finished_at, ports_spec),
+        )
+        scan_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO scan_hosts (scan_id, host, ts, error) VALUES (?, ?, ?, ?)",
+            [(scan_id, host, ts, str(errors[host]) if host in errors else None) for host in open_ports_by_host],
+        )
+        conn.executemany(
+            "INSERT INTO open_ports (scan_id, host, port, ts) VALUES (?, ?, ?, ?)",
+            [(scan_id, host, port, ts) for host, ports in open_ports_by_host.items() for port in ports],
+        )
+    return scan_id
+
+def changes_since_last_scan(conn, host):
+    """
+    Compara os dois últimos scans bem-sucedidos do host.
+    Retorna (abertas_agora, fechadas_agora) ou None se não houver scan anterior.
+    Portas fora do range do scan atual não são consideradas fechadas.
+    """
+    rows = conn.execute(
+        "SELECT h.scan_id, s.ports_spec FROM scan_hosts h JOIN scans s ON s.id = h.scan_id "
+        "WHERE h.host = ? AND h.error IS NULL ORDER BY h.ts DESC LIMIT 2",
+        (host,),
+    ).fetchall()
+    if len(rows) < 2:
+        return None
+    (cur_id, cur_spec), (prev_id, _) = rows
+    query = "SELECT port FROM open_ports WHERE scan_id = ? AND host = ?"
+    current = {r[0] for r in conn.execute(query, (cur_id, host))}
+    previous = {r[0] for r in conn.execute(query, (prev_id, host))}
+    scanned = set(parse_ports(cur_spec))
+    return sorted(current - previous), sorted((previous - current) & scanned)
+
+def hosts_exposing(conn, port, since=None):
+    """
+    Hosts que já tiveram a porta aberta (opcionalmente a partir de `since`, epoch).
+    `Atual` indica se a porta estava aberta no scan mais recente do host.
+    """
+    import pandas as pd
+    sql = (
+        "SELECT o.host, MIN(o.ts), MAX(o.ts), COUNT(*), "
+        "MAX(o.ts) >= (SELECT MAX(h.ts) FROM scan_hosts h WHERE h.host = o.host AND h.error IS NULL) "
+        "FROM open_ports o WHERE o.port = ?"
+    )
+    params = [port]
+    if since is not None:
+        sql += " AND o.ts >= ?"
+        params.append(since)
+    sql += " GROUP BY o.host ORDER BY MAX(o.ts) DESC"
+    df = pd.DataFrame(
+        conn.execute(sql, params).fetchall(),
+        columns=["Host", "Primeira vez", "Última vez", "Scans", "Atual"],
+    )
+    for col in ("Primeira vez", "Última vez"):
+        df[col] = pd.to_datetime(df[col], unit="s")
+    df["Atual"] = df["Atual"].astype(bool)
+    return df
+
+
+# ---- Job em segundo plano ----
+def scan_job(job, targets, ports, ports_spec, timeout=1.0, global_limit=2000, per_host_limit=500):
+    """
+    Scan completo rodando no JobRunner: portas abertas viram itens do job conforme
+    aparecem, e no fim o scan é salvo no histórico com as mudanças por host.
+    """
+    total = len(targets) * len(ports)
+    done = [0]
+
+    def on_result(tgt, port, is_open):
+        done[0] += 1
+        if is_open:
+            job.emit({"Host": tgt, "Porta": port})
+        job.update(done[0] / total)
+
+    start_time = time.time()
+    open_ports_by_host, errors = scan_targets(
+        targets, ports, timeout=timeout, global_limit=global_limit,
+        per_host_limit=per_host_limit, on_result=on_result, stop=job.stop,
+    )
+    result = {
+        "targets": targets, "open_ports": open_ports_by_host, "errors": errors,
+        "started": start_time, "finished": time.time(), "changes": [], "store_error": None,
+    }
+    if job.cancelled:
+        return result  # scan parcial não entra no histórico
+
+    # Salvar no histórico (append-only, uma linha por host/porta)
+    try:
+        conn = open_store()
+        try:
+            save_scan(conn, result["started"], result["finished"], ports_spec, open_ports_by_host, errors)
+            for tgt in targets:
+                diff = changes_since_last_scan(conn, tgt)
+                if diff and (diff[0] or diff[1]):
+                    result["changes"].append({
+                        "Host": tgt,
+                        "Novas abertas": ", ".join(map(str, diff[0])) or "-",
+                        "Fechadas": ", ".join(map(str, diff[1])) or "-",
+                    })
+        finally:
+            conn.close()
+    except Exception as e:
+        result["store_error"] = e
+    return result
+
+
+def show_scan(job):
+    """Desenha o estado do job de scan (parcial enquanto roda, resumo no fim)."""
+    import streamlit as st
+    import pandas as pd
+    st.subheader("Resultados")
+    if job.active:
+        st.progress(job.progress, text=f"{STATUS_LABELS[job.status]} — {job.progress:.0%}")
+        if st.button("⏹️ Cancelar scan"):
+            job.cancel()
+    found = list(job.items)
+    if found:
+        st.dataframe(pd.DataFrame(found), use_container_width=True)
+    elif not job.active:
+        st.info("Nenhuma porta aberta encontrada.")
+    if job.active:
+        return
+
+    if job.error:
+        st.error(f"Erro no scan: {job.error}")
+        return
+    result = job.result
+    for tgt, e in result["errors"].items():
+        st.error(f"Erro ao escanear {tgt}: {e}")
+
+    results = []
+    for tgt in result["targets"]:
+        open_ports = result["open_ports"].get(tgt, [])
+        results.append({"Host": tgt, "Open Ports": ", ".join(map(str, open_ports)) if open_ports else "Nenhuma"})
+
+    elapsed = result["finished"] - result["started"]
+    if job.cancelled:
+        st.warning(f"⏹️ Scan cancelado após {elapsed:.2f}s — resultado parcial (não salvo no histórico).")
+    else:
+        st.success(f"✅ Scan finalizado em {elapsed:.2f}s — resumo por host abaixo.")
+
+    # Exibir resumo (tabela)
+    df = pd.DataFrame(results)
+    st.dataframe(df, use_container_width=True)
+
+    if result["store_error"]:
+        st.warning(f"Não foi possível salvar histórico: {result['store_error']}")
+    elif not job.cancelled:
+        st.info(f"Histórico salvo: `{SCAN_DB}`")
+    if result["changes"]:
+        st.subheader("🔄 Mudanças desde o scan anterior")
+        st.dataframe(pd.DataFrame(result["changes"]), use_container_width=True)
+
+    # Botão para download do CSV
+    csv = df.to_csv(index=False).encode("utf-8")
+    st.download_button("📥 Baixar CSV", csv, "scan_results.csv", "text/csv")
 
 
 def run():
+    import streamlit as st
+
     #st.set_page_config(page_title="Network Port Scanner", page_icon="🛡️", layout="centered")
 
     # ---- Cabeçalho e aviso ----
@@ -114,8 +414,12 @@ def run():
 
     timeout = st.number_input("Timeout por conexão (segundos)", min_value=0.1, max_value=10.0, value=1.0, step=0.1)
     max_workers_input = st.number_input(
-        "Máx de threads simultâneas (concurrency)", min_value=1, max_value=500, value=100, step=1,
-        help="Quantidade de threads usadas no ThreadPoolExecutor. Cuidado com valores muito altos."
+        "Máx de conexões simultâneas (total)", min_value=1, max_value=20000, value=2000, step=100,
+        help="Quantidade de connects TCP em voo ao mesmo tempo somando todos os hosts (asyncio). Cuidado com valores muito altos."
+    )
+    per_host_input = st.number_input(
+        "Máx de conexões simultâneas por host", min_value=1, max_value=20000, value=500, step=50,
+        help="Evita concentrar todo o orçamento em um único host."
     )
 
     st.write("Observação: este scanner realiza tentativas de conexão TCP (connect). Não executa exploits.")
@@ -152,43 +456,41 @@ def run():
             st.error("Nenhuma porta válida informada.")
             st.stop()
 
-        # Rodar scan
-        results = []
-        start_time = datetime.now()
-        with st.spinner("Escaneando... (cada host será verificado sequencialmente)"):
-            for tgt in targets:
-                try:
-                    open_ports = scan_target(tgt, ports, timeout=timeout, max_workers=int(max_workers_input))
-                except Exception as e:
-                    open_ports = []
-                    st.error(f"Erro ao escanear {tgt}: {e}")
-                results.append({"Host": tgt, "Open Ports": ", ".join(map(str, open_ports)) if open_ports else "Nenhuma"})
-
-        end_time = datetime.now()
-        elapsed = (end_time - start_time).total_seconds()
-        st.success(f"✅ Scan finalizado em {elapsed:.2f}s — resultados abaixo.")
-
-        # Exibir resultados (tabela)
-        df = pd.DataFrame(results)
-        st.subheader("Resultados")
-        st.dataframe(df, use_container_width=True)
-
-        # Salvar relatório local (append)
-        try:
-            filename = "scan_report.csv"
-            try:
-                prev = pd.read_csv(filename)
-                out = pd.concat([prev, df], ignore_index=True)
-            except FileNotFoundError:
-                out = df
-            out.to_csv(filename, index=False)
-            st.info(f"Relatório salvo: `{filename}`")
-        except Exception as e:
-            st.warning(f"Não foi possível salvar relatório: {e}")
+        # Rodar scan em segundo plano (todos os hosts em paralelo; a página só acompanha o job)
+        global_limit, per_host_limit = int(max_workers_input), int(per_host_input)
+        key = ("scan", tuple(targets), ports_input, float(timeout), global_limit, per_host_limit)
+        st.session_state["scan_job"] = get_runner().submit(
+            scan_job, targets, ports, ports_input, timeout=timeout,
+            global_limit=global_limit, per_host_limit=per_host_limit,
+            key=key, label=f"Scan de {len(targets)} host(s)",
+        )
 
-        # Botão para download do CSV
-        csv = df.to_csv(index=False).encode("utf-8")
-        st.download_button("📥 Baixar CSV", csv, "scan_results.csv", "text/csv")
+    job = st.session_state.get("scan_job")
+    if job is not None:
+        show_scan(job)
+
+    # ---- Consulta ao histórico ----
+    with st.expander("🗂️ Histórico: quais hosts expõem uma porta?"):
+        query_port = st.number_input("Porta", min_value=1, max_value=65535, value=22, step=1)
+        days = st.number_input("Últimos N dias (0 = todo o histórico)", min_value=0, value=30, step=1)
+        if st.button("Consultar histórico"):
+            since = time.time() - days * 86400 if days else None
+            try:
+                conn = open_store()
+                try:
+                    df_hist = hosts_exposing(conn, int(query_port), since=since)
+                finally:
+                    conn.close()
+                if df_hist.empty:
+                    st.info("Nenhum host com essa porta aberta no período.")
+                else:
+                    st.dataframe(df_hist, use_container_width=True)
+            except Exception as e:
+                st.error(f"Erro ao consultar histórico: {e}")
 
     st.markdown("---")
     st.caption("Nota: Este aplicativo realiza apenas tentativas de conexão TCP (connect). Não realiza exploração de vulnerabilidades. Use com responsabilidade e sempre obtenha autorização.")
+
+    if job is not None and job.active:
+        time.sleep(0.5)
+        st.rerun()
@@ -2,16 +2,21 @@ import streamlit as st
 import platform
 import socket
 import psutil
-import requests
+import threading
+import time
 
+PUBLIC_IP_TTL = 600   # s
+PUBLIC_IP_RETRY = 30  # s, depois de uma falha
 
-def run():
-    st.header("🖥️ Informações do Sistema e Rede")
+_public_ip = {"ip": None, "error": None, "at": 0.0, "thread": None}
+_public_ip_lock = threading.Lock()
 
-    # --- 1. Informações do Sistema ---
-    st.subheader("📋 Sistema Operacional")
+
+@st.cache_data
+def static_info():
+    """Dados que não mudam enquanto o processo roda (uname, CPUs, memória total)."""
     uname = platform.uname()
-    st.write({
+    return {
         "Sistema": uname.system,
         "Nó (Hostname)": uname.node,
         "Release": uname.release,
@@ -22,15 +27,49 @@ def run():
         "CPU Cores (físicos)": psutil.cpu_count(logical=False),
         "CPU Cores (lógicos)": psutil.cpu_count(logical=True),
         "Memória Total (GB)": round(psutil.virtual_memory().total / (1024**3), 2),
-    })
+    }
+
+
+def _fetch_public_ip():
+    import requests  # só na thread de consulta, fora da renderização
+
+    try:
+        ip, error = requests.get("https://api.ipify.org?format=json", timeout=5).json()["ip"], None
+    except Exception as e:
+        ip, error = None, e
+    with _public_ip_lock:
+        _public_ip.update(ip=ip or _public_ip["ip"], error=error, at=time.time(), thread=None)
+
+
+def public_ip():
+    """
+    IP público em cache por PUBLIC_IP_TTL; quando vence, a consulta roda em uma
+    thread de fundo e a página segue com o último valor. Retorna (ip, erro, consultando).
+    """
+    with _public_ip_lock:
+        ttl = PUBLIC_IP_TTL if _public_ip["error"] is None else PUBLIC_IP_RETRY
+        if _public_ip["thread"] is None and time.time() - _public_ip["at"] >= ttl:
+            _public_ip["thread"] = threading.Thread(target=_fetch_public_ip, daemon=True)
+            _public_ip["thread"].start()
+        return _public_ip["ip"], _public_ip["error"], _public_ip["thread"] is not None
+
+
+def run():
+    st.header("🖥️ Informações do Sistema e Rede")
+
+    # --- 1. Informações do Sistema ---
+    st.subheader("📋 Sistema Operacional")
+    st.write(static_info())
 
     # --- 2. IP Público ---
     st.subheader("🌍 IP Público da Conexão")
-    try:
-        ip_public = requests.get("https://api.ipify.org?format=json", timeout=5).json()["ip"]
+    ip_public, error, pending = public_ip()
+    if ip_public:
         st.success(f"Seu IP Público é: **{ip_public}**")
-    except Exception as e:
-        st.error(f"Não foi possível obter IP público: {e}")
+    elif pending:
+        st.info("⏳ Consultando IP público...")
+    else:
+        st.error(f"Não foi possível obter IP público: {error}")
 
     # --- 3. Interfaces de Rede ---
     st.subheader("🌐 Interfaces de Rede")
@@ -50,6 +89,9 @@ def run():
         stats = net_if_stats.get(interface)
         if stats:
             info.append(("Status", "Ativa" if stats.isup else "Inativa"))
-            info.append(("Velocidade (Mbps)", stats.speed))
+            info.append(("Velocidade (Mbps)", str(stats.speed)))  # coluna só de texto: o Arrow converte direto
         st.table(info)
 
+    if pending and not ip_public:
+        time.sleep(0.5)
+        st.rerun()
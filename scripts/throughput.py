@@ -0,0 +1,416 @@
+# throughput.py
+# Medidor de vazão TCP estilo iperf: um servidor simples e um cliente com N streams paralelos.
+# Serve para LAN/segmentos isolados, onde o speedtest.net não alcança.
+
+import os
+import select
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+from scripts.jobs import get_runner, QUEUED
+
+DEFAULT_PORT = 5201
+BUFFER_SIZE = 1 << 20         # 1 MiB por chamada de send/recv
+MAGIC = b"IWTP"
+HEADER = struct.Struct("!4sBd")  # magic, direção, duração (s)
+TOTAL = struct.Struct("!Q")      # bytes recebidos pelo servidor (modo upload)
+UPLOAD, DOWNLOAD = 0, 1          # upload: cliente -> servidor; download: servidor -> cliente
+DIRECTIONS = {"Upload (cliente → servidor)": UPLOAD, "Download (servidor → cliente)": DOWNLOAD}
+IO_TIMEOUT = 10.0
+
+
+def recv_exact(sock, n):
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("Conexão fechada antes do fim do cabeçalho")
+        data += chunk
+    return data
+
+
+class Payload:
+    """
+    Dados enviados pelos streams: um arquivo temporário de BUFFER_SIZE zeros para
+    os.sendfile (zero-copy, o kernel envia direto do page cache) e o mesmo conteúdo
+    em memória para plataformas sem sendfile. Compartilhado entre os streams.
+    """
+
+    def __init__(self, size=BUFFER_SIZE):
+        self.size = size
+        self.buffer = bytes(size)
+        self.file = None
+        if hasattr(os, "sendfile"):
+            self.file = tempfile.TemporaryFile()
+            self.file.write(self.buffer)
+            self.file.flush()
+
+    def send(self, sock):
+        """Envia até `size` bytes e devolve quantos saíram."""
+        if self.file is not None:
+            try:
+                return os.sendfile(sock.fileno(), self.file.fileno(), 0, self.size)
+            except BlockingIOError:
+                # sockets com timeout são não bloqueantes por baixo: espera caber mais
+                select.select([], [sock], [], sock.gettimeout())
+                return 0
+            except OSError as e:
+                if e.errno not in (22, 38, 95):  # EINVAL/ENOSYS/EOPNOTSUPP: cai para send()
+                    raise
+                self.file.close()
+                self.file = None
+        return sock.send(self.buffer)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def send_for(sock, payload, duration, counter, index, stop=None):
+    """Envia continuamente por `duration` segundos somando os bytes em counter[index]."""
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline and not (stop is not None and stop.is_set()):
+        counter[index] += payload.send(sock)
+
+
+def receive_all(sock, counter, index, size=BUFFER_SIZE):
+    """Lê até o EOF em um buffer reutilizável somando os bytes em counter[index]."""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    while True:
+        n = sock.recv_into(view)
+        if not n:
+            return
+        counter[index] += n
+
+
+# ---- Servidor ----
+class ThroughputServer:
+    """
+    Aceita streams em uma thread e atende cada conexão em outra. O cliente manda
+    o cabeçalho (direção, duração): em upload o servidor só lê até o EOF e devolve
+    o total recebido; em download envia pela duração pedida e fecha.
+    """
+
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.payload = Payload()
+        self.connections = 0
+        self.active = 0
+        self.bytes = [0, 0]  # [recebidos, enviados]
+        self.lock = threading.Lock()
+        self.sock = socket.create_server((host, port), backlog=128)
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self._accept_loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self.thread.is_alive()
+
+    def stop(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.thread.join(timeout=2)
+        self.payload.close()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return  # socket fechado por stop()
+            with self.lock:
+                self.connections += 1
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with self.lock:
+            self.active += 1
+        counter = [0]
+        direction = None
+        try:
+            conn.settimeout(IO_TIMEOUT)
+            magic, direction, duration = HEADER.unpack(recv_exact(conn, HEADER.size))
+            if magic != MAGIC:
+                return
+            if direction == UPLOAD:
+                receive_all(conn, counter, 0)
+                conn.sendall(TOTAL.pack(counter[0]))
+            else:
+                send_for(conn, self.payload, min(duration, 3600), counter, 0)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+            with self.lock:
+                self.active -= 1
+                self.bytes[0 if direction == UPLOAD else 1] += counter[0]
+
+
+_servers = {}  # porta -> ThroughputServer (um por processo, compartilhado entre sessões)
+
+
+def get_server(port):
+    server = _servers.get(port)
+    return server if server is not None and server.running else None
+
+
+def start_server(host, port):
+    server = get_server(port)
+    if server is None:
+        server = _servers[port] = ThroughputServer(host, port).start()
+    return server
+
+
+def stop_server(port):
+    server = _servers.pop(port, None)
+    if server is not None:
+        server.stop()
+
+
+# ---- Cliente ----
+def run_client(host, port, streams=4, duration=10.0, direction=UPLOAD, interval=1.0,
+               on_interval=None, stop=None):
+    """
+    Abre `streams` conexões TCP paralelas e mede a vazão por `duration` segundos.
+    A cada `interval` chama on_interval(t, [Mbps por stream]). Retorna bytes e Mbps
+    por stream e agregados; em upload vale o total confirmado pelo servidor.
+    """
+    socks = []
+    try:
+        for _ in range(streams):
+            s = socket.create_connection((host, port), timeout=IO_TIMEOUT)
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            socks.append(s)
+    except OSError:
+        for s in socks:
+            s.close()
+        raise
+
+    counter = [0] * streams
+    confirmed = [None] * streams
+    errors = []
+    payload = Payload() if direction == UPLOAD else None
+
+    remaining = [streams]
+    finished = threading.Event()
+
+    def stream(i, sock):
+        try:
+            sock.sendall(HEADER.pack(MAGIC, direction, duration))
+            if direction == UPLOAD:
+                send_for(sock, payload, duration, counter, i, stop)
+                sock.shutdown(socket.SHUT_WR)
+                confirmed[i] = TOTAL.unpack(recv_exact(sock, TOTAL.size))[0]
+            else:
+                receive_all(sock, counter, i)
+        except OSError as e:
+            errors.append(e)
+        finally:
+            sock.close()
+            with lock:
+                remaining[0] -= 1
+                if not remaining[0]:
+                    finished.set()
+
+    lock = threading.Lock()
+    started = time.perf_counter()
+    for i, s in enumerate(socks):
+        threading.Thread(target=stream, args=(i, s), daemon=True).start()
+
+    # amostra os contadores a cada `interval` (o último intervalo pode ser mais curto)
+    intervals = []
+    last, last_at = [0] * streams, started
+    while True:
+        done = finished.wait(timeout=max(0.0, last_at + interval - time.perf_counter()))
+        now = time.perf_counter()
+        snapshot = list(counter)
+        span = now - last_at
+        mbps = [(b - a) * 8 / span / 1e6 if span > 0 else 0.0 for a, b in zip(last, snapshot)]
+        last, last_at = snapshot, now
+        intervals.append((round(now - started, 3), mbps))
+        if on_interval:
+            on_interval(now - started, mbps)
+        if done:
+            break
+        if stop is not None and stop.is_set() and direction == DOWNLOAD:
+            for sock in socks:  # o servidor só para no fim da duração: corta do nosso lado
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+    elapsed = time.perf_counter() - started
+    if payload is not None:
+        payload.close()
+
+    if stop is not None and stop.is_set():
+        errors = []  # conexões cortadas pela parada não são falhas
+    per_stream = [c if c is not None else b for c, b in zip(confirmed, counter)]
+    if errors and not any(per_stream):
+        raise errors[0]
+    return {
+        "elapsed": elapsed,
+        "bytes": per_stream,
+        "mbps": [b * 8 / elapsed / 1e6 for b in per_stream],
+        "total_mbps": sum(per_stream) * 8 / elapsed / 1e6,
+        "intervals": intervals,
+        "errors": errors,
+    }
+
+
+class ThroughputTest:
+    """
+    Estado de um teste do cliente (intervalos ao vivo). Roda no JobRunner (`execute`):
+    satura o link, então entra no limite de tarefas simultâneas como scan e carga.
+    """
+
+    def __init__(self, host, port, streams, duration, direction):
+        self.kwargs = dict(host=host, port=port, streams=streams, duration=duration, direction=direction)
+        self.intervals = []
+
+    def _on_interval(self, t, mbps):
+        self.intervals.append((t, mbps))
+
+    def execute(self, job):
+        return run_client(**self.kwargs, on_interval=self._on_interval, stop=job.stop)
+
+    def interval_frame(self):
+        import pandas as pd
+        rows = list(self.intervals)
+        df = pd.DataFrame(
+            [[sum(m)] + m for _, m in rows],
+            index=pd.Index([round(t, 1) for t, _ in rows], name="t (s)"),
+            columns=["Total"] + [f"Stream {i + 1}" for i in range(self.kwargs["streams"])],
+        )
+        return df
+
+
+def show_result(test, result):
+    import streamlit as st
+    import pandas as pd
+    from scripts.internetspeed_gauge import speed_gauge  # evita carregar speedtest/plotly antes do resultado
+
+    label = "📤 Upload" if test.kwargs["direction"] == UPLOAD else "📥 Download"
+    color = "blue" if test.kwargs["direction"] == UPLOAD else "green"
+    fig = speed_gauge(result["total_mbps"], f"{label} agregado (Mbps)", color,
+                      [(100, "lightcoral"), (1000, "gold"), (10000, "lightgreen")])
+    st.plotly_chart(fig, use_container_width=True)
+    st.write(f"⏱️ **Duração:** {result['elapsed']:.2f} s — "
+             f"**Total:** {sum(result['bytes']) / 1e6:,.1f} MB em {len(result['bytes'])} stream(s)")
+    st.dataframe(pd.DataFrame({
+        "Stream": range(1, len(result["bytes"]) + 1),
+        "MB": [round(b / 1e6, 1) for b in result["bytes"]],
+        "Mbps": [round(m, 1) for m in result["mbps"]],
+    }), use_container_width=True, hide_index=True)
+    if result["errors"]:
+        st.warning(f"{len(result['errors'])} stream(s) com erro: {result['errors'][0]}")
+
+
+def run():
+    import streamlit as st
+    st.header("🚀 Vazão TCP (LAN)")
+    st.write("Mede a vazão entre dois hosts com **N streams TCP paralelos**, estilo iperf. "
+             "Suba o servidor no host de destino (aqui ou com `python -m scripts.throughput`) e rode o cliente.")
+
+    tab_client, tab_server = st.tabs(["Cliente", "Servidor"])
+
+    with tab_server:
+        bind = st.text_input("Endereço de escuta:", "0.0.0.0")
+        server_port = st.number_input("Porta:", min_value=1, max_value=65535, value=DEFAULT_PORT, key="throughput_server_port")
+        server = get_server(int(server_port))
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Iniciar Servidor", disabled=server is not None):
+                try:
+                    server = start_server(bind, int(server_port))
+                except OSError as e:
+                    st.error(f"Não foi possível abrir a porta {server_port}: {e}")
+        with col2:
+            if st.button("Parar Servidor", disabled=server is None):
+                stop_server(int(server_port))
+                server = None
+        if server is not None:
+            st.success(f"✅ Servidor escutando em {server.host}:{server.port}")
+            st.write(f"Conexões: **{server.connections}** (ativas: {server.active}) — "
+                     f"recebidos: {server.bytes[0] / 1e6:,.1f} MB, enviados: {server.bytes[1] / 1e6:,.1f} MB")
+
+    with tab_client:
+        host = st.text_input("Servidor (IP ou host):", "127.0.0.1")
+        port = st.number_input("Porta:", min_value=1, max_value=65535, value=DEFAULT_PORT, key="throughput_client_port")
+        streams = st.number_input("Streams paralelos:", min_value=1, max_value=128, value=4)
+        duration = st.number_input("Duração (s):", min_value=1, max_value=600, value=10)
+        direction = DIRECTIONS[st.radio("Sentido:", list(DIRECTIONS))]
+
+        job = st.session_state.get("throughput_job")
+        running = job is not None and job.active
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Iniciar Teste", disabled=running):
+                if host in ("127.0.0.1", "localhost", "::1") and get_server(int(port)) is None:
+                    try:
+                        start_server("127.0.0.1", int(port))
+                        st.caption(f"Servidor local iniciado em 127.0.0.1:{port} para o teste em loopback.")
+                    except OSError:
+                        pass  # porta já em uso, talvez por um servidor externo
+                test = ThroughputTest(host, int(port), int(streams), float(duration), direction)
+                key = ("throughput", host, int(port), int(streams), float(duration), direction)
+                job = get_runner().submit(test.execute, key=key, label=f"Vazão TCP {host}", state=test)
+                st.session_state["throughput_job"] = job
+                running = True
+        with col2:
+            if st.button("Parar", disabled=not running):
+                job.cancel()
+
+        if job is None:
+            return
+        test = job.state
+
+        if job.status == QUEUED:
+            st.info("⏳ Na fila: o limite de tarefas simultâneas do servidor foi atingido.")
+        elif running:
+            st.info(f"⏳ Medindo com {test.kwargs['streams']} stream(s)...")
+            if test.intervals:
+                current = sum(test.intervals[-1][1])
+                st.metric("Vazão atual (Mbps)", f"{current:,.1f}")
+        elif job.error:
+            st.error(f"Erro no teste: {job.error}")
+        elif job.result:
+            if job.cancelled:
+                st.warning("Teste interrompido — resultado parcial abaixo.")
+            else:
+                st.success("✅ Teste concluído!")
+            show_result(test, job.result)
+
+        if test.intervals:
+            st.caption("Vazão por intervalo (Mbps)")
+            st.line_chart(test.interval_frame())
+
+        if running:
+            time.sleep(0.5)
+            st.rerun()
+
+
+if __name__ == "__main__":
+    # servidor avulso para o host de destino: python -m scripts.throughput [porta] [endereço]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    bind = sys.argv[2] if len(sys.argv) > 2 else "0.0.0.0"
+    server = ThroughputServer(bind, port).start()
+    print(f"Servidor de vazão escutando em {bind}:{server.port} (Ctrl+C para sair)")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,40 +1,771 @@
-import streamlit as st
 import subprocess
-import pandas as pd
-import matplotlib.pyplot as plt
-import networkx as nx
-import plotly.graph_objects as go
 import requests
 import re
+import os
+import json
+import time
+import sqlite3
+import ipaddress
+import random
+import select
+import socket
+import struct
+import threading
+import concurrent.futures
 
+from scripts.jobs import get_runner, STATUS_LABELS, QUEUED
+from scripts.icmp import build_echo, ECHO_PAYLOAD
 
-def get_geo(ip):
+
+GEO_CACHE_DB = "geo_cache.db"
+GEO_TTL = 7 * 86400          # respostas válidas ficam 7 dias no cache
+GEO_NEGATIVE_TTL = 3600      # falhas/IP sem dados: 1 h, para tentar de novo depois
+GEO_CACHE_MAX = 20000        # acima disso, remove as entradas usadas há mais tempo (LRU)
+GEOIP_DB = os.environ.get("GEOIP_DB", "GeoLite2-City.mmdb")
+
+
+def is_public_ip(ip):
+    """
+    True só para endereços globalmente roteáveis (IPv4 ou IPv6).
+    Privados (RFC 1918, todo o 172.16.0.0/12), CGNAT (100.64.0.0/10), loopback,
+    link-local, ULA IPv6, documentação etc. nunca vão para a rede.
+    """
+    try:
+        return ipaddress.ip_address(ip).is_global
+    except ValueError:
+        return False  # "*" ou texto inválido
+
+
+# ---- Cache persistente (SQLite) com TTL e descarte LRU ----
+_geo_lock = threading.Lock()
+
+
+def _open_geo_cache(path=GEO_CACHE_DB):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS geo ("
+        "ip TEXT PRIMARY KEY, data TEXT, fetched_at REAL NOT NULL, last_used REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_geo_last_used ON geo(last_used)")
+    return conn
+
+
+def geo_cache_get(conn, ips, now=None):
+    """Retorna {ip: dados ou None} para os IPs com entrada válida no cache."""
+    now = now or time.time()
+    ips = list(ips)
+    if not ips:
+        return {}
+    found = {}
+    with _geo_lock, conn:
+        rows = conn.execute(
+            f"SELECT ip, data, fetched_at FROM geo WHERE ip IN ({','.join('?' * len(ips))})", ips
+        ).fetchall()
+        for ip, data, fetched_at in rows:
+            ttl = GEO_TTL if data is not None else GEO_NEGATIVE_TTL
+            if now - fetched_at < ttl:
+                found[ip] = json.loads(data) if data is not None else None
+        conn.executemany("UPDATE geo SET last_used = ? WHERE ip = ?", [(now, ip) for ip in found])
+    return found
+
+
+def geo_cache_put(conn, results, now=None):
+    """Grava {ip: dados ou None} e aplica o limite de tamanho (LRU)."""
+    now = now or time.time()
+    with _geo_lock, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO geo (ip, data, fetched_at, last_used) VALUES (?, ?, ?, ?)",
+            [(ip, json.dumps(data) if data is not None else None, now, now) for ip, data in results.items()],
+        )
+        excess = conn.execute("SELECT COUNT(*) FROM geo").fetchone()[0] - GEO_CACHE_MAX
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM geo WHERE ip IN (SELECT ip FROM geo ORDER BY last_used LIMIT ?)", (excess,)
+            )
+
+
+# ---- Backends de geolocalização ----
+def _fetch_geo_online(ip):
     """Consulta API ip-api.com para pegar dados de geolocalização"""
+    r = requests.get(f"http://ip-api.com/json/{ip}", timeout=3)
+    data = r.json()
+    if data["status"] == "success":
+        return {
+            "country": data.get("country"),
+            "city": data.get("city"),
+            "lat": data.get("lat"),
+            "lon": data.get("lon"),
+            "isp": data.get("isp"),
+        }
+    return None
+
+
+def _offline_reader(path=GEOIP_DB):
+    """Abre a base offline MaxMind GeoLite2 (.mmdb) via pacote opcional geoip2."""
+    import geoip2.database  # dependência opcional, só para hosts sem internet
+    return geoip2.database.Reader(path)
+
+
+def _fetch_geo_offline(reader, ip):
+    import geoip2.errors
     try:
-        if (
-            ip == "*"
-            or ip.startswith("10.")
-            or ip.startswith("192.168")
-            or ip.startswith("172.16")
-            or ip.startswith("127.")
-        ):
-            return None
-        url = f"http://ip-api.com/json/{ip}"
-        r = requests.get(url, timeout=3)
-        data = r.json()
-        if data["status"] == "success":
-            return {
-                "country": data.get("country"),
-                "city": data.get("city"),
-                "lat": data.get("lat"),
-                "lon": data.get("lon"),
-                "isp": data.get("isp"),
-            }
-    except Exception:
+        r = reader.city(ip)
+    except geoip2.errors.AddressNotFoundError:
+        return None
+    return {
+        "country": r.country.name,
+        "city": r.city.name,
+        "lat": r.location.latitude,
+        "lon": r.location.longitude,
+        "isp": None,  # GeoLite2-City não traz ISP
+    }
+
+
+class GeoLocator:
+    """
+    Geolocalização com uma única conexão ao cache e, no modo offline, um único
+    leitor GeoLite2, reaproveitados entre consultas (um por job de traceroute).
+    Pode ser usado por várias threads. Erros de configuração (geoip2 ausente,
+    base .mmdb inexistente) sobem para quem chamou.
+    """
+
+    def __init__(self, offline=False, max_workers=16):
+        self.offline = offline
+        self.max_workers = max_workers
+        self.conn = _open_geo_cache()
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def _reader(self):
+        with self.lock:
+            if self.reader is None:
+                self.reader = _offline_reader()
+            return self.reader
+
+    def lookup(self, ips):
+        """
+        Descarta os IPs não públicos, lê o cache e consulta só o que faltar
+        (em paralelo no modo online). Retorna {ip: dados ou None}.
+        """
+        public = {ip for ip in ips if is_public_ip(ip)}
+        results = {ip: None for ip in ips if ip not in public}
+        if not public:
+            return results
+
+        cached = geo_cache_get(self.conn, public)
+        results.update(cached)
+        missing = sorted(public - cached.keys())
+        if not missing:
+            return results
+
+        fetched = {}
+        if self.offline:
+            reader = self._reader()
+            for ip in missing:
+                fetched[ip] = _fetch_geo_offline(reader, ip)
+        else:
+            def fetch(ip):
+                try:
+                    return ip, _fetch_geo_online(ip), True
+                except Exception:
+                    return ip, None, False  # erro de rede: não vai para o cache
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as ex:
+                for ip, data, ok in ex.map(fetch, missing):
+                    results[ip] = data
+                    if ok:
+                        fetched[ip] = data
+        results.update(fetched)
+        geo_cache_put(self.conn, fetched)
+        return results
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+        self.conn.close()
+
+
+def get_geo_many(ips, offline=False, max_workers=16):
+    """
+    Geolocaliza vários IPs de uma vez (ver GeoLocator.lookup). Retorna {ip: dados ou None}.
+    offline=True usa a base GeoLite2 local (GEOIP_DB) em vez da API.
+    """
+    locator = GeoLocator(offline, max_workers)
+    try:
+        return locator.lookup(ips)
+    finally:
+        locator.close()
+
+
+HOP_RE = re.compile(r"^\s*(\d+)\s+(.*)$")
+RTT_RE = re.compile(r"([\d.]+)\s*ms")
+
+
+def parse_hop_line(line):
+    """
+    Parseia uma linha de `traceroute -n`, ex.: " 3  200.1.2.3  10.1 ms  9.8 ms  9.9 ms".
+    Retorna (hop, ip, avg_rtt) — ip é "*" se nenhuma sonda respondeu — ou None
+    para linhas que não são de hop (cabeçalho, avisos).
+    """
+    m = HOP_RE.match(line)
+    if not m:
+        return None
+    hop, rest = int(m.group(1)), m.group(2)
+    parts = rest.split()
+    ip = next((p for p in parts if p != "*"), "*") if parts else "*"
+    if ip != "*" and not is_ip(ip):
+        ip = "*"
+    rtts = [float(x) for x in RTT_RE.findall(rest)]
+    avg_rtt = sum(rtts) / len(rtts) if rtts else None
+    return hop, ip, avg_rtt
+
+
+def is_ip(value):
+    try:
+        ipaddress.ip_address(value)
+        return True
+    except ValueError:
+        return False
+
+
+def resolve(target):
+    """
+    IPv4 do destino (para saber quando o caminho chegou), ou None se não resolver.
+    Só IPv4: os dois motores sondam por IPv4, e o primeiro resultado do
+    getaddrinfo pode ser um IPv6 em hosts dual-stack, que nunca casaria com o hop final.
+    """
+    try:
+        return socket.getaddrinfo(target, None, socket.AF_INET, socket.SOCK_DGRAM)[0][4][0]
+    except socket.gaierror:
+        return None
+
+
+def stream_traceroute(target, max_silent=5, max_hops=30):
+    """
+    Roda `traceroute -n` e entrega (hop, ip, avg_rtt) conforme cada linha chega.
+    Para cedo (encerrando o processo) quando o destino responde ou depois de
+    `max_silent` hops seguidos sem resposta. Levanta RuntimeError se o
+    traceroute terminar com erro.
+    """
+    dest_ip = resolve(target)
+    proc = subprocess.Popen(
+        ["traceroute", "-n", "-m", str(max_hops), dest_ip or target],  # o IP resolvido fixa a família
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+    )
+    silent = 0
+    stopped_early = False
+    try:
+        for line in proc.stdout:
+            parsed = parse_hop_line(line)
+            if parsed is None:
+                continue
+            yield parsed
+            _, ip, _ = parsed
+            silent = silent + 1 if ip == "*" else 0
+            if (dest_ip and ip == dest_ip) or silent >= max_silent:
+                stopped_early = True
+                break
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+        proc.wait()
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+    if not stopped_early and proc.returncode != 0:
+        raise RuntimeError(stderr)
+
+
+# ---- Motor nativo: todas as TTLs em paralelo ----
+UDP_BASE_PORT = 33434
+
+
+def _parse_icmp_reply(packet):
+    """
+    Interpreta um pacote recebido no socket ICMP raw (com cabeçalho IP).
+    Retorna (tipo, origem, proto_original, id_ou_porta_origem, seq_ou_porta_destino)
+    ou None. Para Time Exceeded/Unreachable os campos vêm do pacote original
+    embutido; para Echo Reply, do próprio cabeçalho ICMP.
+    """
+    if len(packet) < 28:
         return None
+    ihl = (packet[0] & 0x0F) * 4
+    src = socket.inet_ntoa(packet[12:16])
+    icmp_type = packet[ihl]
+    if icmp_type == 0:  # echo reply
+        ident, seq = struct.unpack("!HH", packet[ihl + 4:ihl + 8])
+        return icmp_type, src, socket.IPPROTO_ICMP, ident, seq
+    if icmp_type in (3, 11):  # destination unreachable / time exceeded
+        inner = packet[ihl + 8:]
+        if len(inner) < 28:
+            return None
+        inner_ihl = (inner[0] & 0x0F) * 4
+        proto = inner[9]
+        a, b = struct.unpack("!HH", inner[inner_ihl:inner_ihl + 4])
+        if proto == socket.IPPROTO_ICMP:
+            a, b = struct.unpack("!HH", inner[inner_ihl + 4:inner_ihl + 8])
+        return icmp_type, src, proto, a, b
+    return None
+
+
+def native_probe(target, max_hops=30, probes=3, timeout=2.0, protocol="udp"):
+    """
+    Uma rodada de sondas (IPv4, precisa de NET_RAW): envia de uma vez `probes`
+    sondas para cada TTL de 1 a `max_hops` (UDP para portas altas ou ICMP echo)
+    e associa cada resposta ICMP à sonda original pela porta/seq embutida.
+    Termina em uma janela de `timeout` ou assim que todas as sondas das TTLs
+    até o destino responderam. Retorna ({ttl: (ip, rtts_ms)}, menor TTL em que
+    o destino respondeu ou None); TTLs sem resposta não aparecem no dict.
+    """
+    dest = socket.gethostbyname(target)
+    recv = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    if protocol == "udp":
+        send = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        send.bind(("", 0))
+        ident = send.getsockname()[1]
+    else:
+        send = recv
+        ident = random.randrange(1, 0xFFFF)
+
+    sent_at = {}  # índice da sonda -> instante de envio
+    try:
+        for ttl in range(1, max_hops + 1):
+            send.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+            for n in range(probes):
+                index = (ttl - 1) * probes + n
+                if protocol == "udp":
+                    send.sendto(ECHO_PAYLOAD, (dest, UDP_BASE_PORT + index))
+                else:
+                    send.sendto(build_echo(ident, index), (dest, 0))
+                sent_at[index] = time.perf_counter()
+
+        replies = {}          # ttl -> (ip, [rtts])
+        dest_ttl = None
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            if dest_ttl and all(len(replies.get(t, (None, []))[1]) == probes for t in range(1, dest_ttl + 1)):
+                break
+            ready, _, _ = select.select([recv], [], [], remaining)
+            if not ready:
+                break
+            packet = recv.recv(2048)
+            now = time.perf_counter()
+            parsed = _parse_icmp_reply(packet)
+            if parsed is None:
+                continue
+            icmp_type, src, proto, a, b = parsed
+            if protocol == "udp":
+                if proto != socket.IPPROTO_UDP or a != ident:
+                    continue
+                index = b - UDP_BASE_PORT
+            else:
+                if proto != socket.IPPROTO_ICMP or a != ident:
+                    continue
+                index = b
+            if index not in sent_at:
+                continue
+            ttl = index // probes + 1
+            ip, rtts = replies.setdefault(ttl, (src, []))
+            rtts.append((now - sent_at[index]) * 1000)
+            if src == dest and (dest_ttl is None or ttl < dest_ttl):
+                dest_ttl = ttl
+    finally:
+        recv.close()
+        if send is not recv:
+            send.close()
+    return replies, dest_ttl
+
+
+def native_traceroute(target, max_hops=30, probes=3, timeout=2.0, protocol="udp"):
+    """
+    Traceroute próprio com todas as TTLs em paralelo (ver native_probe).
+    Retorna lista de (hop, ip, rtts_ms) até o destino, ou até a última TTL que respondeu.
+    """
+    replies, dest_ttl = native_probe(target, max_hops, probes, timeout, protocol)
+    last = dest_ttl or (max(replies) if replies else 0)
+    return [
+        (ttl, replies[ttl][0], replies[ttl][1]) if ttl in replies else (ttl, "*", [])
+        for ttl in range(1, last + 1)
+    ]
+
+
+# ---- Monitoramento contínuo (estilo MTR) ----
+class HopStats:
+    """
+    Estatísticas acumuladas de um hop em memória constante: perda, último/melhor/
+    pior RTT, média e desvio padrão (Welford) e jitter médio (|RTT - RTT anterior|).
+    """
+
+    __slots__ = ("ip", "sent", "received", "last", "best", "worst", "mean", "m2", "jitter_sum", "jitter_n")
+
+    def __init__(self):
+        self.ip = "*"
+        self.sent = 0
+        self.received = 0
+        self.last = None
+        self.best = float("inf")
+        self.worst = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.jitter_sum = 0.0
+        self.jitter_n = 0
+
+    def add(self, ip, rtts):
+        """Registra uma rodada (uma sonda por hop); `rtts` vazio conta como perda."""
+        self.sent += 1
+        if not rtts:
+            return
+        self.ip = ip
+        rtt = rtts[0]
+        self.received += 1
+        if self.last is not None:
+            self.jitter_sum += abs(rtt - self.last)
+            self.jitter_n += 1
+        self.last = rtt
+        self.best = min(self.best, rtt)
+        self.worst = max(self.worst, rtt)
+        delta = rtt - self.mean
+        self.mean += delta / self.received
+        self.m2 += delta * (rtt - self.mean)
+
+    def row(self, hop):
+        got = self.received
+        return {
+            "hop": hop,
+            "ip": self.ip,
+            "Loss %": round(100 * (self.sent - got) / self.sent, 1) if self.sent else 0.0,
+            "Snt": self.sent,
+            "Last": round(self.last, 2) if got else None,
+            "Avg": round(self.mean, 2) if got else None,
+            "Best": round(self.best, 2) if got else None,
+            "Wrst": round(self.worst, 2) if got else None,
+            "StDev": round((self.m2 / (got - 1)) ** 0.5, 2) if got > 1 else None,
+            "Jitter": round(self.jitter_sum / self.jitter_n, 2) if self.jitter_n else None,
+        }
+
+
+class PathMonitor:
+    """
+    Sonda o caminho continuamente com o motor nativo (uma sonda por TTL a cada
+    `interval` s), rodando no JobRunner (`execute`) até `duration` s ou o cancelamento.
+    Mantém só um HopStats por TTL, então uma hora de monitoramento custa o mesmo que um minuto.
+    """
+
+    def __init__(self, target, protocol="udp", interval=1.0, max_hops=30, duration=3600):
+        self.target = target
+        self.protocol = protocol
+        self.interval = interval
+        self.max_hops = max_hops
+        self.duration = duration
+        self.stats = [HopStats() for _ in range(max_hops)]
+        self.path_len = 0
+        self.dest_ttl = None
+        self.rounds = 0
+        self.started = None
+        self.lock = threading.Lock()
+
+    def execute(self, job):
+        self.started = time.time()
+        while not job.cancelled and time.time() - self.started < self.duration:
+            round_start = time.monotonic()
+            replies, dest_ttl = native_probe(
+                self.target, max_hops=self.max_hops, probes=1,
+                timeout=self.interval, protocol=self.protocol,
+            )
+            with self.lock:
+                # comprimento estável: o menor TTL em que o destino já respondeu. Assim uma
+                # resposta perdida do destino não cria um hop fantasma na TTL seguinte, e
+                # toda TTL até ele conta a rodada (sem resposta = perda, como no MTR)
+                if dest_ttl:
+                    self.dest_ttl = min(self.dest_ttl or dest_ttl, dest_ttl)
+                self.path_len = self.dest_ttl or max(self.path_len, max(replies, default=0))
+                for ttl in range(1, self.path_len + 1):
+                    ip, rtts = replies.get(ttl, ("*", []))
+                    self.stats[ttl - 1].add(ip, rtts)
+                self.rounds += 1
+            job.update((time.time() - self.started) / self.duration, f"{self.rounds} rodadas")
+            job.stop.wait(max(0.0, self.interval - (time.monotonic() - round_start)))
+        return self.rounds
+
+    def table(self):
+        import pandas as pd
+        with self.lock:
+            return pd.DataFrame([self.stats[i].row(i + 1) for i in range(self.path_len)])
+
+
+def continuous_ui(target):
+    """Modo contínuo: inicia/para o PathMonitor e redesenha tabela e gráficos a partir dos agregados."""
+    import streamlit as st
+    protocol = "udp" if st.radio("Protocolo das sondas", ["UDP", "ICMP"], horizontal=True) == "UDP" else "icmp"
+    interval = st.number_input("Intervalo entre rodadas (s)", min_value=0.5, max_value=10.0, value=1.0, step=0.5)
+    minutes = st.number_input("Duração máxima (min)", min_value=1, max_value=24 * 60, value=60, step=5)
+
+    job = st.session_state.get("traceroute_monitor_job")
+    running = job is not None and job.active
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("▶️ Iniciar monitoramento", disabled=running):
+            monitor = PathMonitor(target, protocol, float(interval), duration=minutes * 60)
+            job = get_runner().submit(
+                monitor.execute, key=("path_monitor", target, protocol, float(interval), int(minutes)),
+                label=f"Monitoramento {target}", state=monitor,
+            )
+            st.session_state["traceroute_monitor_job"] = job
+            running = True
+    with col2:
+        if st.button("⏹️ Parar", disabled=not running):
+            job.cancel()
+
+    if job is None:
+        return
+    monitor = job.state
+    if job.status == QUEUED:
+        st.info("⏳ Na fila: o limite de tarefas simultâneas do servidor foi atingido.")
+    if job.error:
+        if isinstance(job.error, PermissionError):
+            st.error("O modo contínuo usa o motor nativo e precisa de socket raw (capability NET_RAW ou root).")
+        else:
+            st.error(f"Erro no monitoramento: {job.error}")
+
+    df = monitor.table()
+    elapsed = int(job.elapsed)
+    st.caption(f"Destino `{monitor.target}` — {monitor.rounds} rodadas em {elapsed // 60} min {elapsed % 60} s")
+    if not df.empty:
+        st.subheader("📋 Estatísticas por hop")
+        st.dataframe(df, use_container_width=True)
+        chart = df.set_index("hop")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.caption("Perda por hop (%)")
+            st.bar_chart(chart[["Loss %"]])
+        with col2:
+            st.caption("RTT por hop (ms)")
+            st.line_chart(chart[["Best", "Avg", "Wrst"]])
+
+    if running:
+        time.sleep(max(1.0, float(interval)))
+        st.rerun()
+
+
+def hop_row(hop, ip, avg_rtt, geo):
+    return {
+        "hop": hop,
+        "ip": ip,
+        "avg_rtt": avg_rtt,
+        "country": geo["country"] if geo else None,
+        "city": geo["city"] if geo else None,
+        "isp": geo["isp"] if geo else None,
+        "lat": geo["lat"] if geo else None,
+        "lon": geo["lon"] if geo else None,
+    }
+
+
+def rtt_colors(rtts, max_rtt):
+    """Cor por faixa de RTT (verde até 50% do máximo, laranja abaixo do máximo, vermelho no máximo)."""
+    import pandas as pd
+    colors = pd.Series("lightgray", index=rtts.index)
+    colors[rtts <= max_rtt * 0.5] = "lightgreen"
+    colors[(rtts > max_rtt * 0.5) & (rtts < max_rtt)] = "orange"
+    colors[rtts >= max_rtt] = "red"
+    return colors
+
+
+def render_visuals(df):
+    """
+    Mapa lógico, mapa geográfico e RTT por hop a partir da tabela final.
+    São sempre três figuras plotly montadas com operações vetorizadas, então o
+    custo de renderizar não cresce com uma figura por hop.
+    """
+    import streamlit as st
+    import plotly.graph_objects as go
+    rtts = df["avg_rtt"].astype(float)
+    max_rtt = rtts.max() if rtts.notna().any() else 0.0
+    colors = rtt_colors(rtts, max_rtt)
+    labels = "Hop " + df["hop"].astype(str) + " — " + df["ip"] + "<br>RTT médio: " + rtts.round(2).astype(str) + " ms"
+
+    # --- Mapa lógico: o caminho é uma cadeia, então o layout é só a posição do hop
+    st.subheader("🗺️ Mapa lógico de hops")
+    fig_chain = go.Figure(go.Scatter(
+        x=df["hop"],
+        y=[0] * len(df),
+        mode="lines+markers+text",
+        text=df["ip"],
+        textposition=["top center" if i % 2 == 0 else "bottom center" for i in range(len(df))],
+        hovertext=labels,
+        hoverinfo="text",
+        marker=dict(size=22, color=colors, line=dict(width=1, color="gray")),
+        line=dict(width=2, color="lightblue"),
+    ))
+    fig_chain.update_layout(
+        height=220,
+        margin={"r": 20, "t": 10, "l": 20, "b": 20},
+        xaxis=dict(title="Hop", dtick=1),
+        yaxis=dict(visible=False, range=[-1, 1]),
+        showlegend=False,
+    )
+    st.plotly_chart(fig_chain, use_container_width=True)
+
+    # --- Mapa geográfico (plotly)
+    st.subheader("🌍 Mapa geográfico dos hops")
+    geo_df = df.dropna(subset=["lat", "lon"])
+    if not geo_df.empty:
+        fig_geo = go.Figure()
+
+        fig_geo.add_trace(
+            go.Scattergeo(
+                lon=geo_df["lon"],
+                lat=geo_df["lat"],
+                text=(
+                    labels[geo_df.index] + "<br>"
+                    + geo_df["city"].astype(str) + ", " + geo_df["country"].astype(str)
+                    + "<br>ISP: " + geo_df["isp"].astype(str)
+                ),
+                mode="markers+lines",
+                marker=dict(size=8, color="blue"),
+                line=dict(width=2, color="red"),
+            )
+        )
+
+        fig_geo.update_layout(
+            geo=dict(
+                projection_type="natural earth",
+                showland=True,
+                landcolor="lightgray",
+                countrycolor="white",
+            ),
+            height=600,
+            margin={"r":0,"t":0,"l":0,"b":0},
+        )
+
+        st.plotly_chart(fig_geo, use_container_width=True)
+    else:
+        st.warning("Nenhum hop retornou dados de geolocalização.")
+
+    # --- Atraso por hop: uma única figura de barras no lugar de um velocímetro por hop
+    st.subheader("⏱️ Atraso por hop (RTT médio)")
+    answered = rtts.notna()
+    if not answered.any():
+        st.warning("Nenhum hop retornou RTT.")
+        return
+    fig_rtt = go.Figure(go.Bar(
+        x=df.loc[answered, "hop"],
+        y=rtts[answered],
+        marker_color=colors[answered],
+        text=rtts[answered].round(1),
+        textposition="outside",
+        hovertext=labels[answered],
+        hoverinfo="text",
+    ))
+    fig_rtt.add_hline(y=max_rtt, line=dict(color="red", width=2, dash="dash"))
+    fig_rtt.update_layout(
+        height=350,
+        margin={"r": 20, "t": 20, "l": 20, "b": 20},
+        xaxis=dict(title="Hop", dtick=1),
+        yaxis=dict(title="RTT médio (ms)", range=[0, max_rtt * 1.2]),
+    )
+    st.plotly_chart(fig_rtt, use_container_width=True)
+
+
+def traceroute_job(job, target, engine, max_silent=5, offline=False, max_hops=30):
+    """
+    Traceroute (comando ou nativo) rodando no JobRunner: cada hop vira um item do
+    job e a geolocalização dos IPs públicos é resolvida em paralelo para job.state,
+    com um único GeoLocator por job. Falhas da geolocalização viram itens de aviso (str).
+    """
+    geos = job.state
+    locator = GeoLocator(offline)
+    warned = set()
+
+    def geo_done(future):
+        e = future.exception()
+        if e is None:
+            geos.update(future.result())
+        elif str(e) not in warned:
+            warned.add(str(e))
+            job.emit(f"Geolocalização indisponível: {type(e).__name__}: {e}")
+
+    def locate(ips):
+        ips = [ip for ip in dict.fromkeys(ips) if ip not in geos and is_public_ip(ip)]
+        if ips:
+            geos.update(dict.fromkeys(ips))
+            ex.submit(locator.lookup, ips).add_done_callback(geo_done)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as ex:
+            if engine.startswith("Nativo"):
+                protocol = "udp" if "UDP" in engine else "icmp"
+                job.update(message="Sondando todas as TTLs...")
+                path = [
+                    (hop, ip, sum(rtts) / len(rtts) if rtts else None)
+                    for hop, ip, rtts in native_traceroute(target, max_hops=max_hops, protocol=protocol)
+                ]
+                locate([ip for _, ip, _ in path])  # caminho completo: uma consulta só
+            else:
+                job.update(message="Rodando traceroute...")
+                path = stream_traceroute(target, max_silent=max_silent, max_hops=max_hops)
+            try:
+                for hop, ip, avg_rtt in path:
+                    if job.cancelled:
+                        break
+                    job.emit((hop, ip, avg_rtt))
+                    job.update(hop / max_hops)
+                    locate([ip])
+            finally:
+                if hasattr(path, "close"):
+                    path.close()  # encerra o processo do traceroute se paramos antes
+    finally:
+        locator.close()
+    return [item for item in job.items if isinstance(item, tuple)]
+
+
+def show_traceroute(job):
+    import streamlit as st
+    import pandas as pd
+    st.subheader("📋 Tabela de Hops")
+    if job.active:
+        st.progress(job.progress, text=f"{STATUS_LABELS[job.status]} — {job.message}")
+        if st.button("⏹️ Cancelar"):
+            job.cancel()
+    elif job.error:
+        e = job.error
+        if isinstance(e, FileNotFoundError):
+            st.error("O comando `traceroute` não está disponível no sistema/container.")
+        elif isinstance(e, RuntimeError):
+            st.error(f"Erro ao executar traceroute:\n{e}")
+        elif isinstance(e, PermissionError):
+            st.error("O motor nativo precisa de socket raw (capability NET_RAW ou root).")
+        else:
+            st.error(f"Erro no traceroute: {e}")
+        return
+
+    items = list(job.items)
+    for warning in (item for item in items if isinstance(item, str)):
+        st.warning(warning)
+    hops = [item for item in items if isinstance(item, tuple)]
+    if not hops:
+        if not job.active:
+            st.warning("Nenhum hop retornado.")
+        return
+
+    geos = dict(job.state)
+    df = pd.DataFrame([hop_row(h, i, r, geos.get(i)) for h, i, r in hops])
+    st.dataframe(df)
+    if job.active:
+        st.subheader("📈 Latência média por hop")
+        st.line_chart(df.set_index("hop")[["avg_rtt"]])
+    else:
+        render_visuals(df)
 
 
 def run():
+    import streamlit as st
+
     #st.set_page_config(page_title="Traceroute Visual", layout="wide")
 
     st.title("🌐 Traceroute com Visualização Geográfica")
@@ -43,163 +774,37 @@ def run():
             "⚠️ Necessário que o container/host tenha `traceroute` instalado.")
 
     target = st.text_input("Destino (ex: google.com)", "8.8.8.8")
+    mode = st.radio("Modo", ["Snapshot", "Contínuo (estilo MTR)"], horizontal=True)
+    if mode.startswith("Contínuo"):
+        continuous_ui(target)
+        return
+    geo_backend = st.radio(
+        "Geolocalização",
+        ["ip-api.com (online)", "Base offline GeoLite2 (.mmdb)"],
+        help=f"A base offline é lida de `{GEOIP_DB}` (variável GEOIP_DB) e requer o pacote opcional `geoip2`.",
+    )
+    offline = geo_backend.startswith("Base offline")
+    engine = st.radio(
+        "Motor",
+        ["Comando traceroute (hop a hop)", "Nativo UDP (todas as TTLs em paralelo)", "Nativo ICMP (todas as TTLs em paralelo)"],
+        help="O motor nativo usa sockets raw (NET_RAW) e termina em cerca de uma janela de timeout.",
+    )
+    max_silent = st.number_input(
+        "Parar após N hops seguidos sem resposta", min_value=1, max_value=30, value=5, step=1,
+        help="O traceroute também para assim que o destino responde.",
+    )
 
     if st.button("Rodar Traceroute"):
-        try:
-            result = subprocess.run(
-                ["traceroute", "-n", target],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
+        st.session_state["traceroute_job"] = get_runner().submit(
+            traceroute_job, target, engine, int(max_silent), offline,
+            key=("traceroute", target, engine, int(max_silent), offline),
+            label=f"Traceroute {target}", state={},
+        )
 
-            if result.returncode != 0:
-                st.error(f"Erro ao executar traceroute:\n{result.stderr}")
-            else:
-                # Parseando saída
-                lines = result.stdout.strip().split("\n")
-                hops = []
-                for line in lines[1:]:
-                    parts = re.split(r"\s+", line.strip())
-                    if len(parts) < 2:
-                        continue
-                    hop = int(parts[0])
-                    ip = parts[1]
-                    rtts = [
-                        float(p.replace("ms", ""))
-                        for p in parts[2:]
-                        if "ms" in p and p.replace("ms", "").replace(".", "").isdigit()
-                    ]
-                    avg_rtt = sum(rtts) / len(rtts) if rtts else None
-                    geo = get_geo(ip)
-                    hops.append(
-                        {
-                            "hop": hop,
-                            "ip": ip,
-                            "avg_rtt": avg_rtt,
-                            "country": geo["country"] if geo else None,
-                            "city": geo["city"] if geo else None,
-                            "isp": geo["isp"] if geo else None,
-                            "lat": geo["lat"] if geo else None,
-                            "lon": geo["lon"] if geo else None,
-                        }
-                    )
-
-                df = pd.DataFrame(hops)
-
-                st.subheader("📋 Tabela de Hops")
-                st.dataframe(df)
-
-                # --- Gráfico de linhas
-                st.subheader("📈 Latência média por hop")
-                fig, ax = plt.subplots()
-                ax.plot(df["hop"], df["avg_rtt"], marker="o")
-                ax.set_xlabel("Hop")
-                ax.set_ylabel("RTT médio (ms)")
-                ax.set_title("Evolução da latência ao longo do caminho")
-                st.pyplot(fig)
-
-                # --- Mapa de rede (networkx)
-                st.subheader("🗺️ Mapa lógico de hops")
-                G = nx.DiGraph()
-                for i in range(len(df) - 1):
-                    G.add_edge(
-                        df.iloc[i]["ip"],
-                        df.iloc[i + 1]["ip"],
-                        weight=df.iloc[i + 1]["avg_rtt"] or 0,
-                    )
-                pos = nx.spring_layout(G, seed=42)
-                fig2, ax2 = plt.subplots(figsize=(8, 6))
-                nx.draw(
-                    G,
-                    pos,
-                    with_labels=True,
-                    node_size=1200,
-                    node_color="lightblue",
-                    font_size=8,
-                    ax=ax2,
-                )
-                st.pyplot(fig2)
-
-                # --- Mapa geográfico (plotly)
-                st.subheader("🌍 Mapa geográfico dos hops")
-                geo_df = df.dropna(subset=["lat", "lon"])
-                if not geo_df.empty:
-                    fig_geo = go.Figure()
-
-                    fig_geo.add_trace(
-                        go.Scattergeo(
-                            lon=geo_df["lon"],
-                            lat=geo_df["lat"],
-                            text=geo_df.apply(
-                                lambda row: f"Hop {row['hop']} - {row['ip']}<br>"
-                                f"{row['city']}, {row['country']}<br>"
-                                f"ISP: {row['isp']}<br>"
-                                f"RTT médio: {row['avg_rtt']} ms",
-                                axis=1,
-                            ),
-                            mode="markers+lines",
-                            marker=dict(size=8, color="blue"),
-                            line=dict(width=2, color="red"),
-                        )
-                    )
-
-                    fig_geo.update_layout(
-                        geo=dict(
-                            projection_type="natural earth",
-                            showland=True,
-                            landcolor="lightgray",
-                            countrycolor="white",
-                        ),
-                        height=600,
-                        margin={"r":0,"t":0,"l":0,"b":0},
-                    )
-
-                    st.plotly_chart(fig_geo, use_container_width=True)
-                else:
-                    st.warning("Nenhum hop retornou dados de geolocalização.")
-
-                # --- Velocímetro (opcional)
-                #if st.checkbox("📊 Mostrar velocímetros de atraso por hop"):
-                st.subheader("⏱️ Velocímetros de atraso (RTT por hop)")
-                for _, row in df.iterrows():
-                    if row["avg_rtt"] is None:
-                        continue
-                    gauge = go.Figure(
-                        go.Indicator(
-                            mode="gauge+number",
-                            value=row["avg_rtt"],
-                            title={"text": f"Hop {row['hop']} ({row['ip']})"},
-                            gauge={
-                                "axis": {
-                                    "range": [0, max(df["avg_rtt"].dropna()) * 1.2]
-                                },
-                                "bar": {"color": "blue"},
-                                "steps": [
-                                    {
-                                        "range": [
-                                            0,
-                                            max(df["avg_rtt"].dropna()) * 0.5,
-                                        ],
-                                        "color": "lightgreen",
-                                    },
-                                    {
-                                        "range": [
-                                            max(df["avg_rtt"].dropna()) * 0.5,
-                                            max(df["avg_rtt"].dropna()),
-                                        ],
-                                        "color": "orange",
-                                    },
-                                ],
-                                "threshold": {
-                                    "line": {"color": "red", "width": 4},
-                                    "thickness": 0.75,
-                                    "value": max(df["avg_rtt"].dropna()),
-                                },
-                            },
-                        )
-                    )
-                    st.plotly_chart(gauge, use_container_width=True)
-
-        except FileNotFoundError:
-            st.error("O comando `traceroute` não está disponível no sistema/container.")
+    job = st.session_state.get("traceroute_job")
+    if job is None:
+        return
+    show_traceroute(job)
+    if job.active:
+        time.sleep(0.5)
+        st.rerun()